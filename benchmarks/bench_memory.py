@@ -0,0 +1,136 @@
+"""一般模式與低記憶體模式 (LOW_MEMORY_MODE) 的記憶體 / 啟動處理時間比較。
+
+不連線 Discord：以 bot.py 的 client_options() 建立 discord.py 的連線狀態，
+再餵入模擬的 GUILD_CREATE 與 GUILD_MEMBERS_CHUNK 資料 (與 Gateway 送來的格式相同)，
+量測處理時間與 RSS 增加量。每個模式在獨立的子行程中執行，互不影響。
+
+    python benchmarks/bench_memory.py --guilds 5 --members 50000
+"""
+import os
+import gc
+import sys
+import time
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Gateway 每個成員分批 (chunk) 最多 1000 人
+CHUNK_SIZE = 1000
+# 模擬的線上比例 (有 presence 資料的成員)
+ONLINE_RATIO = 0.3
+
+def guild_payload(guild_id, members, channels=50, roles=30):
+    return {
+        "id": str(guild_id),
+        "name": f"bench-{guild_id}",
+        "owner_id": "1",
+        "member_count": members,
+        "large": members > 250,
+        "features": [],
+        "emojis": [],
+        "stickers": [],
+        "roles": [{"id": str(guild_id if i == 0 else guild_id * 1000 + i), "name": f"role-{i}", "permissions": "0",
+                   "position": i, "color": 0, "hoist": False, "managed": False, "mentionable": False} for i in range(roles)],
+        "channels": [{"id": str(guild_id * 100000 + i), "type": 0, "name": f"channel-{i}", "position": i,
+                      "permission_overwrites": []} for i in range(channels)],
+        "members": [member_payload(999)],
+        "presences": [],
+        "voice_states": [],
+        "threads": [],
+        "stage_instances": [],
+        "guild_scheduled_events": [],
+    }
+
+def member_payload(user_id, role_ids=()):
+    return {
+        "user": {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "global_name": None, "avatar": None, "bot": user_id % 20 == 0},
+        "roles": list(role_ids),
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+def presence_payload(user_id):
+    return {"user": {"id": str(user_id)}, "status": "online", "activities": [{"name": "benchmark", "type": 0}], "client_status": {"desktop": "online"}}
+
+def rss_mb():
+    import psutil
+    gc.collect()
+    return psutil.Process().memory_info().rss / 1024 / 1024
+
+def run_mode(low_memory, guilds, members):
+    import discord
+    import bot
+
+    options = bot.client_options(low_memory)
+    client = discord.Client(**options)
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data={"id": "999", "username": "bench", "discriminator": "0", "avatar": None})
+
+    before = rss_mb()
+    start = time.perf_counter()
+    chunks = 0
+    for g in range(1, guilds + 1):
+        guild = state._add_guild_from_data(guild_payload(g, members))
+        if not state._guild_needs_chunking(guild):
+            continue
+        # 一般模式：啟動時要求該伺服器全部成員，Gateway 分批回傳 (含線上成員的 presence)
+        role_ids = [str(g * 1000 + 1), str(g * 1000 + 2)]
+        for offset in range(0, members, CHUNK_SIZE):
+            ids = range(g * 10_000_000 + offset, g * 10_000_000 + min(offset + CHUNK_SIZE, members))
+            chunk = {
+                "guild_id": str(g),
+                "members": [member_payload(i, role_ids) for i in ids],
+                "presences": [presence_payload(i) for i in ids if (i % 100) < ONLINE_RATIO * 100] if options["intents"].presences else [],
+            }
+            # 與 discord.py 處理 GUILD_MEMBERS_CHUNK 相同：建立成員、套用 presence，再依快取設定加入伺服器
+            chunk_members = [discord.Member(guild=guild, data=m, state=state) for m in chunk["members"]]
+            by_id = {str(m.id): m for m in chunk_members}
+            for presence in chunk["presences"]:
+                by_id[presence["user"]["id"]]._presence_update(presence, presence["user"])
+            if state.member_cache_flags.joined:
+                for member in chunk_members:
+                    guild._add_member(member)
+            chunks += 1
+    elapsed = time.perf_counter() - start
+    after = rss_mb()
+
+    return {
+        "mode": "low" if low_memory else "full",
+        "intents": options["intents"].value,
+        "cached_members": sum(len(g.members) for g in client.guilds),
+        "chunk_payloads": chunks,
+        "process_seconds": round(elapsed, 3),
+        "rss_delta_mb": round(after - before, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=5)
+    parser.add_argument("--members", type=int, default=50000, help="每個伺服器的成員數")
+    parser.add_argument("--mode", choices=("full", "low"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode == "low", args.guilds, args.members)))
+        return
+
+    results = []
+    for mode in ("full", "low"):
+        out = subprocess.run([sys.executable, __file__, "--mode", mode, "--guilds", str(args.guilds), "--members", str(args.members)],
+                             cwd=ROOT, capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{args.guilds} 個伺服器 x {args.members} 位成員")
+    print(f"{'模式':<6}{'快取成員':>12}{'成員分批':>10}{'處理秒數':>10}{'RSS 增加 (MB)':>16}")
+    for r in results:
+        print(f"{r['mode']:<6}{r['cached_members']:>12}{r['chunk_payloads']:>10}{r['process_seconds']:>10}{r['rss_delta_mb']:>16}")
+    # Gateway 送出成員請求有速率限制，實際啟動時間還要加上網路傳輸，分批數量越多越久
+    print(f"\n處理秒數不含網路傳輸；一般模式啟動時還需等待 Gateway 依速率限制送完上述 {results[0]['chunk_payloads']} 批成員資料。")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""冷啟動時間量測：模組匯入時間 (依模組細分) 與 setup_hook 完成時間。
+
+每一輪都在新的子行程中執行 (避免模組快取)，工作目錄為暫存資料夾，不會留下 log/ 檔案；
+setup_hook 以替身 (stub) 取代斜線指令同步，不需要 Token 也不會連線 Discord。
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --budget-ms 600   # 超過預算時回傳非 0，可放進 CI
+
+啟動時不應載入的套件 (LAZY_MODULES) 若出現在匯入紀錄中，也會視為退步。
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 專案內的模組
+PROJECT_MODULES = sorted(name[:-3] for name in os.listdir(ROOT) if name.endswith(".py"))
+# 只在第一次使用時才載入的套件
+LAZY_MODULES = ("whois", "dns", "geoip2", "GPUtil", "psutil", "fastapi", "uvicorn")
+# 直譯器本身啟動時就會載入的模組，不列入比較
+INTERPRETER_MODULES = ("site", "encodings")
+# 顯示最慢的套件數量
+TOP_PACKAGES = 8
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def _run_child(args):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    with tempfile.TemporaryDirectory() as cwd:
+        return subprocess.run([sys.executable, *args], cwd=cwd, env=env, capture_output=True, text=True, check=True)
+
+# --- 匯入時間 ---
+# 解析 -X importtime 的輸出，回傳 {模組: (自身微秒, 累計微秒)}
+def measure_imports():
+    out = _run_child(["-X", "importtime", "-c", "import bot"])
+    modules = {}
+    for line in out.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us))
+    return modules
+
+# --- setup_hook ---
+# 在子行程中執行：匯入 bot、以替身取代指令同步後執行 setup_hook，並記錄各步驟耗時
+SETUP_HOOK_SCRIPT = r'''
+import json, time, asyncio, functools
+import bot
+
+import http_client, metrics, tickets
+import commands as bot_commands
+
+steps = {}
+def timed(owner, attr, label):
+    original = getattr(owner, attr)
+    if asyncio.iscoroutinefunction(original):
+        @functools.wraps(original)
+        async def wrapper(*args, **kwargs):
+            t = time.perf_counter()
+            try: return await original(*args, **kwargs)
+            finally: steps[label] = steps.get(label, 0) + time.perf_counter() - t
+    else:
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            t = time.perf_counter()
+            try: return original(*args, **kwargs)
+            finally: steps[label] = steps.get(label, 0) + time.perf_counter() - t
+    setattr(owner, attr, wrapper)
+
+async def fake_sync(guild=None):
+    return []
+
+async def main():
+    client = bot.bot
+    client.tree.sync = fake_sync
+    client._connection.application_id = 0
+    timed(http_client, "start", "http_client.start")
+    timed(metrics, "install_rest_timing", "metrics.install_rest_timing")
+    timed(tickets.ticket_registry, "load", "ticket_registry.load")
+    timed(bot_commands, "setup_commands", "commands.setup_commands")
+    timed(bot, "sync_commands", "sync_commands (stub)")
+    t = time.perf_counter()
+    await client.setup_hook()
+    setup_seconds = time.perf_counter() - t
+    await client.close()
+    print(json.dumps({"setup_hook": setup_seconds, "steps": steps}))
+
+asyncio.run(main())
+'''
+
+def measure_setup_hook():
+    out = _run_child(["-c", SETUP_HOOK_SCRIPT])
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def _median_ms(values):
+    return statistics.median(values) / 1000 if values else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, help="import bot + setup_hook 的中位數上限 (毫秒)")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出結果")
+    args = parser.parse_args()
+
+    import_runs = [measure_imports() for _ in range(args.runs)]
+    hook_runs = [measure_setup_hook() for _ in range(args.runs)]
+
+    cumulative = lambda name: [run[name][1] for run in import_runs if name in run]
+    project = {name: _median_ms(cumulative(name)) for name in PROJECT_MODULES if cumulative(name)}
+    packages = {name: _median_ms(cumulative(name)) for name in import_runs[0]
+                if "." not in name and name not in PROJECT_MODULES and name not in INTERPRETER_MODULES and not name.startswith("_")}
+    slowest = dict(sorted(packages.items(), key=lambda item: item[1], reverse=True)[:TOP_PACKAGES])
+    loaded_lazy = sorted({name for run in import_runs for name in run if name.split(".")[0] in LAZY_MODULES and "." not in name})
+
+    steps = {}
+    for run in hook_runs:
+        for label, seconds in run["steps"].items():
+            steps.setdefault(label, []).append(seconds * 1000)
+    result = {
+        "import_bot_ms": _median_ms(cumulative("bot")),
+        "setup_hook_ms": statistics.median(run["setup_hook"] * 1000 for run in hook_runs),
+        "project_modules_ms": project,
+        "slowest_packages_ms": slowest,
+        "setup_hook_steps_ms": {label: statistics.median(values) for label, values in steps.items()},
+        "eagerly_loaded_lazy_modules": loaded_lazy,
+    }
+    total = result["import_bot_ms"] + result["setup_hook_ms"]
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print(f"執行 {args.runs} 輪 (中位數)")
+        print(f"\nimport bot: {result['import_bot_ms']:.1f} ms")
+        print("  專案模組 (累計，含其匯入的套件)：")
+        for name, ms in sorted(project.items(), key=lambda item: item[1], reverse=True):
+            print(f"    {name:<14}{ms:>9.1f} ms")
+        print("  最慢的套件：")
+        for name, ms in slowest.items():
+            print(f"    {name:<14}{ms:>9.1f} ms")
+        print(f"\nsetup_hook: {result['setup_hook_ms']:.1f} ms")
+        for label, ms in result["setup_hook_steps_ms"].items():
+            print(f"    {label:<30}{ms:>9.1f} ms")
+        print(f"\n合計: {total:.1f} ms")
+
+    failed = False
+    if loaded_lazy:
+        print(f"⚠️ 啟動時已載入應延後載入的套件: {', '.join(loaded_lazy)}", file=sys.stderr)
+        failed = True
+    if args.budget_ms is not None and total > args.budget_ms:
+        print(f"⚠️ 啟動時間 {total:.1f} ms 超過預算 {args.budget_ms:.1f} ms", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
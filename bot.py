@@ -1,4 +1,6 @@
 import os
+import json
+import hashlib
 import discord
 from discord.ext import commands
 from discord import app_commands
@@ -6,39 +8,201 @@ from dotenv import load_dotenv
 from datetime import datetime
 import asyncio
 import error
+import http_client
+import monitor
+import metrics
+import utils
 import tickets
+import transcripts
+import cluster
+import guild_stats
 import commands as bot_commands
 
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 
-class DNSBot(commands.Bot):
-    def __init__(self):
+# --- 分片設定 ---
+# SHARDED=1 時改用 AutoShardedBot，在同一個行程中維持多條 Gateway 連線；
+# 只設定 SHARD_COUNT 時負責全部分片，多行程部署請改用 cluster.py 啟動 (會自動設定 SHARD_IDS)
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', 0)) or None
+SHARD_IDS = [int(i) for i in os.getenv('SHARD_IDS', '').split(',') if i.strip()] or None
+SHARDED = os.getenv('SHARDED', '0') == '1' or SHARD_COUNT is not None
+
+# 只有第一個叢集 (或單一行程) 負責同步斜線指令與回填對話紀錄索引等全域工作
+IS_PRIMARY = cluster.CLUSTER_ID in (None, 0)
+
+# --- 斜線指令同步設定 ---
+# 指令樹的指紋與上次同步時相同就略過同步 (全域同步的速率限制很嚴格)
+COMMAND_SYNC_STATE = os.path.join("log", "command_sync.json")
+# 設為 1 時無論指紋是否相同都強制同步
+FORCE_COMMAND_SYNC = os.getenv('FORCE_COMMAND_SYNC', '0') == '1'
+# (選填) 開發用伺服器 ID：設定後只同步到該伺服器 (立即生效)，不更動全域指令
+DEV_GUILD_ID = int(os.getenv('DEV_GUILD_ID', 0)) or None
+
+# --- 記憶體設定 ---
+# LOW_MEMORY_MODE=1 時只開啟必要的 Intents，不快取成員、不在啟動時分批載入 (chunk) 成員，
+# 需要成員資料的地方改用 utils.get_member 按需查詢
+LOW_MEMORY_MODE = os.getenv('LOW_MEMORY_MODE', '0') == '1'
+
+def client_options(low_memory=LOW_MEMORY_MODE):
+    if not low_memory:
         intents = discord.Intents.all()
         intents.members = True
-        super().__init__(command_prefix='/', intents=intents)
+        return {"intents": intents}
+
+    intents = discord.Intents.none()
+    intents.guilds = True           # 頻道/身分組資料與事件 (客服單索引需要)
+    intents.members = True          # 只接收成員加入/離開事件以維護人數統計 (不快取成員)
+    intents.message_content = True  # 匯出對話紀錄時需要讀取訊息內容
+    return {
+        "intents": intents,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+        "max_messages": None,
+    }
+
+# 指令樹的穩定指紋：序列化後排序鍵值再雜湊，指令內容不變時結果相同
+def command_fingerprint(tree, guild=None):
+    payload = [command.to_dict() for command in tree.get_commands(guild=guild)]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def _load_sync_state():
+    try:
+        with open(COMMAND_SYNC_STATE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_sync_state(state):
+    os.makedirs(os.path.dirname(COMMAND_SYNC_STATE), exist_ok=True)
+    with open(COMMAND_SYNC_STATE, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+
+# 只有指令變更 (或強制同步) 時才呼叫同步 API；回傳是否有同步
+async def sync_commands(bot):
+    guild = None
+    if DEV_GUILD_ID:
+        guild = discord.Object(id=DEV_GUILD_ID)
+        bot.tree.copy_global_to(guild=guild)
+
+    # 以應用程式 ID 區分，換成另一個機器人的 Token 時會重新同步
+    target = f"{bot.application_id}:{DEV_GUILD_ID or 'global'}"
+    fingerprint = command_fingerprint(bot.tree, guild)
+    state = await asyncio.to_thread(_load_sync_state)
+    if not FORCE_COMMAND_SYNC and state.get(target) == fingerprint:
+        error.logger.info("斜線指令未變更，略過同步。")
+        return False
+
+    error.logger.info(f"正在同步斜線指令 ({'開發伺服器 ' + str(DEV_GUILD_ID) if DEV_GUILD_ID else '全域'})...")
+    await bot.tree.sync(guild=guild)
+    state[target] = fingerprint
+    await asyncio.to_thread(_save_sync_state, state)
+    return True
+
+class DNSBot(commands.AutoShardedBot if SHARDED else commands.Bot):
+    def __init__(self):
+        # 未設定分片數時由 Discord 建議的數量決定
+        shard_options = {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if SHARDED else {}
+        super().__init__(command_prefix='/', **client_options(), **shard_options)
+        self.start_time = datetime.now()
 
     async def setup_hook(self):
-        error.logger.info("正在同步斜線指令...")
-        
+        # 建立全域共用的 HTTP 連線池 (ip-api、Webhook 共用)
+        await http_client.start()
+        # 啟動 Webhook 日誌背景發送器
+        error.webhook_shipper.start()
+        # 啟動系統狀態背景取樣
+        monitor.system_sampler.start()
+        monitor.loop_lag_monitor.start()
+        # 記錄每個指令花在 Discord API 的時間
+        metrics.install_rest_timing()
+        # (選填) 啟動 OpenMetrics 監控端點
+        if metrics.METRICS_ENABLED:
+            await metrics.start_server(self)
+
         self.tree.on_error = self.on_app_command_error
 
+        # 載入上次保存的客服單索引 (on_ready 時會再由頻道重建)
+        await tickets.ticket_registry.load()
+        # 將索引建立前的舊對話紀錄補進全文檢索 (只執行一次，於背景進行)
+        if transcripts.TRANSCRIPT_INDEX and IS_PRIMARY:
+            transcripts.transcript_index.start_backfill()
+
         self.add_view(tickets.TicketLauncher())
         self.add_view(tickets.TicketControls())
+        self.add_view(bot_commands.HelpView())
+
+        bot_commands.setup_commands(self.tree)
         
-        bot_commands.setup_commands(self.tree, bot_start_time)
-        
-        await self.tree.sync()
+        # 斜線指令是全域設定，多個叢集只需同步一次
+        if IS_PRIMARY:
+            await sync_commands(self)
+        # (叢集模式) 定期與其他叢集交換統計
+        cluster.cluster_client.start(self)
         error.logger.info("機器人已準備就緒！")
 
+    async def close(self):
+        await super().close()
+        await cluster.cluster_client.stop()
+        monitor.system_sampler.stop()
+        await monitor.loop_lag_monitor.stop()
+        await metrics.stop_server()
+        await utils.ip_api_scheduler.stop()
+        await utils.close_whois()
+        await transcripts.transcript_index.close()
+        await error.webhook_shipper.stop()
+        await http_client.close()
+
+    # --- 客服單索引與伺服器統計維護 ---
+    async def on_ready(self):
+        count = tickets.ticket_registry.rebuild(self.guilds)
+        error.logger.info(f"客服單索引已重建: {count} 個客服單")
+        guild_stats.guild_stats.rebuild(self.guilds)
+
+    async def on_guild_join(self, guild):
+        guild_stats.guild_stats.seed(guild)
+
+    async def on_guild_channel_create(self, channel):
+        tickets.ticket_registry.add(channel)
+        guild_stats.guild_stats.channel_created(channel)
+
+    async def on_guild_channel_delete(self, channel):
+        tickets.ticket_registry.remove(channel)
+        guild_stats.guild_stats.channel_deleted(channel)
+
+    async def on_guild_channel_update(self, before, after):
+        if before.name != after.name or getattr(before, "topic", None) != getattr(after, "topic", None):
+            tickets.ticket_registry.remove(before)
+            tickets.ticket_registry.add(after)
+        guild_stats.guild_stats.channel_updated(before, after)
+
+    async def on_guild_remove(self, guild):
+        tickets.ticket_registry.remove_guild(guild.id)
+        guild_stats.guild_stats.remove_guild(guild.id)
+
+    async def on_member_join(self, member):
+        guild_stats.guild_stats.member_joined(member)
+
+    async def on_raw_member_remove(self, payload):
+        guild_stats.guild_stats.member_left(payload.guild_id, payload.user)
+
+    async def on_guild_role_create(self, role):
+        guild_stats.guild_stats.role_created(role)
+
+    async def on_guild_role_delete(self, role):
+        guild_stats.guild_stats.role_deleted(role)
+
     async def on_app_command_error(self, interaction: discord.Interaction, error_obj: app_commands.AppCommandError):
         await error.handle_command_error(interaction, error_obj, self)
 
-bot_start_time = datetime.now()
 bot = DNSBot()
 
-if __name__ == "__main__":
+def main():
+    error.setup_logging()
     if TOKEN:
         bot.run(TOKEN)
     else:
-        error.logger.error("錯誤：找不到 DISCORD_TOKEN，請檢查 .env 檔案。")
\ No newline at end of file
+        error.logger.error("錯誤：找不到 DISCORD_TOKEN，請檢查 .env 檔案。")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
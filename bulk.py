@@ -0,0 +1,163 @@
+import os
+import csv
+import json
+import asyncio
+import utils
+import http_client
+from datetime import datetime
+
+# --- 批量查詢設定 ---
+# DNS 同時查詢數量 (WHOIS 另以 WHOIS_WORKERS 為上限，避免佔滿 WHOIS 執行緒池)
+BULK_CONCURRENCY = int(os.getenv('BULK_CONCURRENCY', 20))
+# 單次最多處理的網域數量
+BULK_MAX_DOMAINS = int(os.getenv('BULK_MAX_DOMAINS', 10000))
+# 進度訊息更新間隔 (秒)
+BULK_PROGRESS_INTERVAL = float(os.getenv('BULK_PROGRESS_INTERVAL', 3))
+# 每累積多少筆結果寫入一次檔案
+BULK_FLUSH_ROWS = 100
+BULK_DIR = os.path.join("log", "bulk")
+
+DNS_COLUMNS = ["domain", *utils.DNS_RECORD_TYPES, "error"]
+WHOIS_COLUMNS = ["domain", "registrar", "creation_date", "expiration_date", "name_servers", "error"]
+
+# --- 輸入：逐行讀取附件，不將整個檔案載入記憶體 ---
+# 超過 BULK_MAX_DOMAINS 時停止讀取，並在 stats["truncated"] 標記清單未處理完
+async def iter_domains(url, stats):
+    session = http_client.get_session()
+    seen = 0
+    async with session.get(url) as response:
+        response.raise_for_status()
+        async for raw in response.content:
+            line = raw.decode('utf-8', errors='ignore').strip()
+            if not line or line.startswith('#'): continue
+            # CSV 只取第一欄
+            domain = utils.clean_domain(line.split(',')[0].strip().strip('"').lower())
+            if "." not in domain: continue
+            if seen >= BULK_MAX_DOMAINS:
+                stats["truncated"] = True
+                break
+            yield domain
+            seen += 1
+
+# --- 單筆查詢 ---
+async def lookup_dns(domain):
+    # 不使用共用的 DNS 快取：大量一次性的網域會擠掉 /dns 的常用項目
+    results = await utils.resolve_all(domain, cache=None)
+    row = {"domain": domain}
+    for rdtype, records in results.items():
+        row[rdtype] = ";".join(utils.format_dns_record(rdtype, r) for r in records) if records else ""
+    return row
+
+async def lookup_whois(domain):
+    w = await utils.get_whois_info(domain)
+    return {
+        "domain": domain,
+        "registrar": w["registrar"] or "",
+        "creation_date": utils.format_whois_date(w["creation_date"]),
+        "expiration_date": utils.format_whois_date(w["expiration_date"]),
+        "name_servers": ";".join(w["name_servers"]),
+    }
+
+# --- 輸出：分批寫入檔案 (在執行緒中進行，不阻塞事件迴圈) ---
+class ResultWriter:
+    def __init__(self, path, columns, fmt):
+        self.path = path
+        self.columns = columns
+        self.fmt = fmt
+        self._buffer = []
+        self._file = None
+        self._csv = None
+        # 多個查詢協程共用同一個檔案，寫入時需依序進行
+        self._lock = asyncio.Lock()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, "w", encoding="utf-8", newline="")
+        if self.fmt == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction="ignore")
+            self._csv.writeheader()
+
+    def _write_rows(self, rows):
+        for row in rows:
+            if self._csv:
+                self._csv.writerow(row)
+            else:
+                self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    async def open(self):
+        await asyncio.to_thread(self._open)
+
+    async def write(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= BULK_FLUSH_ROWS:
+            await self.flush()
+
+    async def flush(self):
+        rows, self._buffer = self._buffer, []
+        if rows:
+            async with self._lock:
+                await asyncio.to_thread(self._write_rows, rows)
+
+    async def close(self):
+        await self.flush()
+        if self._file:
+            await asyncio.to_thread(self._file.close)
+
+# --- 批量查詢主流程 ---
+# on_progress(stats) 會定期被呼叫，用於更新進度訊息；回傳 (輸出檔路徑, 統計)
+async def run_bulk(url, mode, fmt, on_progress=None):
+    if mode == "whois":
+        lookup, columns, concurrency = lookup_whois, WHOIS_COLUMNS, min(BULK_CONCURRENCY, utils.WHOIS_WORKERS)
+    else:
+        lookup, columns, concurrency = lookup_dns, DNS_COLUMNS, BULK_CONCURRENCY
+
+    path = os.path.join(BULK_DIR, f"bulk-{mode}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}")
+    writer = ResultWriter(path, columns, fmt)
+    await writer.open()
+
+    stats = {"read": 0, "done": 0, "errors": 0, "truncated": False}
+    # 佇列有上限：讀取速度受查詢速度牽制，記憶體用量與清單長度無關
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def producer():
+        try:
+            async for domain in iter_domains(url, stats):
+                await queue.put(domain)
+                stats["read"] += 1
+        finally:
+            for _ in range(concurrency):
+                await queue.put(None)
+
+    async def worker():
+        while True:
+            domain = await queue.get()
+            if domain is None: return
+            try:
+                row = await lookup(domain)
+            except Exception as e:
+                row = {"domain": domain, "error": str(e)[:200]}
+                stats["errors"] += 1
+            await writer.write(row)
+            stats["done"] += 1
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(BULK_PROGRESS_INTERVAL)
+            try: await on_progress(stats)
+            except Exception: pass
+
+    progress_task = asyncio.create_task(reporter()) if on_progress else None
+    try:
+        results = await asyncio.gather(producer(), *[worker() for _ in range(concurrency)], return_exceptions=True)
+    finally:
+        if progress_task:
+            progress_task.cancel()
+        await writer.close()
+
+    # 讀取附件失敗時將錯誤往上拋，交給 error.py 處理
+    for result in results:
+        if isinstance(result, Exception):
+            os.remove(path)
+            raise result
+
+    return path, stats
@@ -0,0 +1,239 @@
+import os
+import math
+import time
+import pickle
+import asyncio
+import secrets
+import threading
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+import aiohttp
+from dotenv import load_dotenv
+import error
+import metrics
+import guild_stats
+
+# --- 叢集設定 ---
+# 啟動的行程數量；分片會平均切成連續的區段分給各行程
+CLUSTER_COUNT = int(os.getenv('CLUSTER_COUNT', 2))
+# 本行程的叢集編號 (由 cluster.py 啟動子行程時設定；單一行程執行 bot.py 時為 None)
+CLUSTER_ID = int(os.getenv('CLUSTER_ID')) if os.getenv('CLUSTER_ID') else None
+# 行程間通訊 (IPC) 位址；金鑰未設定時由啟動器隨機產生並傳給子行程
+CLUSTER_IPC_HOST = '127.0.0.1'
+CLUSTER_IPC_PORT = int(os.getenv('CLUSTER_IPC_PORT', 9200))
+CLUSTER_IPC_AUTHKEY = os.getenv('CLUSTER_IPC_AUTHKEY', '')
+# 各叢集回報統計的間隔 (秒)；超過 3 個間隔未回報的叢集不列入彙總
+CLUSTER_STATS_INTERVAL = float(os.getenv('CLUSTER_STATS_INTERVAL', 15))
+# 子行程結束後重新啟動前的等待秒數
+CLUSTER_RESTART_DELAY = float(os.getenv('CLUSTER_RESTART_DELAY', 10))
+# 每個分片登入 (IDENTIFY) 預留的秒數，依序啟動各叢集以免同時登入被限速
+IDENTIFY_INTERVAL = 5.5
+
+GATEWAY_BOT_URL = "https://discord.com/api/v10/gateway/bot"
+
+# --- 彙總中心 (在啟動器行程中執行) ---
+# 每個叢集定期送出自己的統計，中心回覆所有叢集的彙總結果
+class ClusterHub:
+    def __init__(self, address, authkey):
+        self.listener = Listener(address, authkey=authkey)
+        self.reports = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._accept, name="cluster-hub", daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return
+            except Exception:
+                # 金鑰錯誤等連線失敗，略過該連線
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    report = pickle.loads(conn.recv_bytes())
+                except (EOFError, OSError):
+                    return
+                with self._lock:
+                    self.reports[report["cluster"]] = report
+                    summary = self.aggregate()
+                conn.send(summary)
+
+    def aggregate(self):
+        cutoff = time.time() - CLUSTER_STATS_INTERVAL * 3
+        reports = [r for r in self.reports.values() if r["time"] >= cutoff]
+        sketches, errors = {}, {}
+        for report in reports:
+            for name, phases in report["sketches"].items():
+                for phase, sketch in phases.items():
+                    sketches.setdefault(name, {}).setdefault(phase, metrics.LatencySketch()).merge(sketch)
+            for name, count in report["errors"].items():
+                errors[name] = errors.get(name, 0) + count
+        return {
+            "clusters": len(reports),
+            "shards": sum(len(r["shards"]) for r in reports),
+            "guilds": sum(r["guilds"] for r in reports),
+            "users": sum(r["users"] for r in reports),
+            "members": sum(r["members"] for r in reports),
+            "sketches": sketches,
+            "errors": errors,
+        }
+
+    def close(self):
+        self.listener.close()
+
+# --- 叢集端 (在每個機器人行程中執行) ---
+class ClusterClient:
+    def __init__(self):
+        self.summary = None
+        self._conn = None
+        self._task = None
+
+    def start(self, bot):
+        if CLUSTER_ID is None: return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try: await self._task
+            except asyncio.CancelledError: pass
+            self._task = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _run(self, bot):
+        while True:
+            # 在事件迴圈中序列化 (統計資料只在迴圈中修改)，收發交給執行緒
+            payload = pickle.dumps(self._report(bot))
+            try:
+                self.summary = await asyncio.to_thread(self._exchange, payload)
+            except Exception as e:
+                error.logger.warning(f"叢集 {CLUSTER_ID} 回報統計失敗: {e}")
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+            await asyncio.sleep(CLUSTER_STATS_INTERVAL)
+
+    def _exchange(self, payload):
+        if self._conn is None:
+            self._conn = Client((CLUSTER_IPC_HOST, CLUSTER_IPC_PORT), authkey=CLUSTER_IPC_AUTHKEY.encode())
+        self._conn.send_bytes(payload)
+        return self._conn.recv()
+
+    def _report(self, bot):
+        shards = list(bot.shards) if hasattr(bot, "shards") else [bot.shard_id or 0]
+        return {
+            "cluster": CLUSTER_ID,
+            "time": time.time(),
+            "shards": shards,
+            "guilds": len(bot.guilds),
+            "users": len(bot.users),
+            "members": guild_stats.guild_stats.total_members,
+            "sketches": metrics.command_sketches,
+            "errors": metrics.command_errors,
+        }
+
+cluster_client = ClusterClient()
+
+# --- 跨叢集彙總資料 (單一行程或尚未收到彙總時使用本行程的資料) ---
+def total_guilds(bot):
+    return cluster_client.summary["guilds"] if cluster_client.summary else len(bot.guilds)
+
+def total_members():
+    return cluster_client.summary["members"] if cluster_client.summary else guild_stats.guild_stats.total_members
+
+def command_sketches():
+    return cluster_client.summary["sketches"] if cluster_client.summary else metrics.command_sketches
+
+def command_errors():
+    return cluster_client.summary["errors"] if cluster_client.summary else metrics.command_errors
+
+# --- 啟動器 ---
+# 將分片平均切成 cluster_count 段連續區間
+def shard_ranges(shard_count, cluster_count):
+    per_cluster = math.ceil(shard_count / cluster_count)
+    return [list(range(start, min(start + per_cluster, shard_count))) for start in range(0, shard_count, per_cluster)]
+
+# 向 Discord 查詢建議的分片數量
+async def recommended_shard_count(token):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_BOT_URL, headers={"Authorization": f"Bot {token}"}) as resp:
+            resp.raise_for_status()
+            return (await resp.json())["shards"]
+
+# 子行程進入點；分片相關設定已由啟動器放在環境變數中 (spawn 啟動的子行程會繼承)
+def _run_cluster():
+    import bot
+    bot.main()
+
+def main():
+    load_dotenv()
+    error.setup_logging()
+    token = os.getenv('DISCORD_TOKEN')
+    if not token:
+        error.logger.error("錯誤：找不到 DISCORD_TOKEN，請檢查 .env 檔案。")
+        return
+
+    shard_count = int(os.getenv('SHARD_COUNT', 0)) or asyncio.run(recommended_shard_count(token))
+    ranges = shard_ranges(shard_count, min(CLUSTER_COUNT, shard_count))
+    authkey = CLUSTER_IPC_AUTHKEY or secrets.token_hex(16)
+    # ip-api 的限額以來源 IP 計算，由各叢集平分
+    env = {
+        "CLUSTER_IPC_AUTHKEY": authkey,
+        "IP_API_RATE": str(max(1, int(os.getenv('IP_API_RATE', 45)) // len(ranges))),
+        "IP_API_BATCH_RATE": str(max(1, int(os.getenv('IP_API_BATCH_RATE', 15)) // len(ranges))),
+    }
+
+    hub = ClusterHub((CLUSTER_IPC_HOST, CLUSTER_IPC_PORT), authkey.encode())
+    hub.start()
+    error.logger.info(f"叢集啟動: {shard_count} 個分片 / {len(ranges)} 個行程")
+
+    ctx = multiprocessing.get_context("spawn")
+    processes = {}
+
+    def launch(cluster_id):
+        shard_ids = ranges[cluster_id]
+        os.environ.update(env)
+        os.environ.update(
+            CLUSTER_ID=str(cluster_id),
+            SHARD_IDS=",".join(map(str, shard_ids)),
+            SHARD_COUNT=str(shard_count),
+        )
+        process = ctx.Process(target=_run_cluster, name=f"cluster-{cluster_id}")
+        process.start()
+        processes[cluster_id] = process
+        error.logger.info(f"叢集 {cluster_id} 已啟動 (分片 {shard_ids[0]}-{shard_ids[-1]}, PID {process.pid})")
+
+    try:
+        for cluster_id in range(len(ranges)):
+            launch(cluster_id)
+            # 等前一個叢集的分片都登入後再啟動下一個
+            time.sleep(IDENTIFY_INTERVAL * len(ranges[cluster_id]))
+
+        # 監看子行程，異常結束時重新啟動
+        while True:
+            time.sleep(CLUSTER_RESTART_DELAY)
+            for cluster_id, process in list(processes.items()):
+                if not process.is_alive():
+                    error.logger.warning(f"叢集 {cluster_id} 已結束 (代碼 {process.exitcode})，重新啟動中...")
+                    launch(cluster_id)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=10)
+        hub.close()
+
+if __name__ == "__main__":
+    main()
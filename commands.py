@@ -2,194 +2,155 @@ import discord
 from discord import app_commands
 from discord.ui import Select, View
 import asyncio
-import dns.resolver
-import whois
+import os
 import utils
+import bulk
 import error
 import tickets
+import transcripts
 from datetime import datetime
 import time
-import psutil
+import monitor
+import metrics
+import cluster
+import guild_stats
+
+# /ping 顯示的歷史區間 (分鐘)
+PING_HISTORY_MINUTES = 10
+
+# /stats 顯示的計時階段 (階段 -> 名稱)
+STATS_PHASE_LABELS = {
+    "total": "⏱️ 總耗時",
+    "defer": "📨 首次回應",
+    "dns": "🌐 DNS",
+    "ip-api": "🔍 IP 查詢",
+    "whois": "📋 WHOIS",
+    "discord": "💬 Discord API",
+}
+
+# /dns 顯示的紀錄欄位 (紀錄類型 -> 欄位名稱)
+DNS_FIELD_LABELS = {
+    "A": "📌 A Record",
+    "AAAA": "📌 AAAA Record",
+    "CNAME": "🔗 CNAME",
+    "MX": "📧 MX Record",
+    "TXT": "📝 TXT Record",
+    "NS": "🌐 NS Record",
+    "SOA": "🏛️ SOA Record",
+}
 
 #        UI 組件：Help 下拉選單
 
+HELP_BANNER_URL = "https://i.pinimg.com/736x/46/f5/b4/46f5b4064a5bf82b9d4af012313d2f95.jpg" # 您可以換成自己的橫幅圖，或設為 None
+
+def format_uptime(bot):
+    return str(datetime.now() - bot.start_time).split('.')[0]
+
+def _help_embed(title, description, color, fields, inline=False):
+    embed = discord.Embed(title=title, description=description, color=color)
+    for name, value in fields:
+        embed.add_field(name=name, value=value, inline=inline)
+    return embed
+
+# --- Help 頁面 ---
+# 靜態內容在啟動時建立一次；每次查詢只複製範本並填入 HELP_DYNAMIC_FIELDS 的欄位與頁尾
+HELP_DYNAMIC_FIELDS = {
+    "⏱️ 運行時間": lambda bot: f"`{format_uptime(bot)}`",
+    "💓 延遲": lambda bot: f"`{round(bot.latency * 1000)} ms`",
+    "💓 系統延遲": lambda bot: f"`{round(bot.latency * 1000)} ms`",
+    "📚 指令總數": lambda bot: f"`{len(bot.tree.get_commands())}` 個",
+    "🏰 伺服器數": lambda bot: f"`{cluster.total_guilds(bot)}` 個",
+    "👥 成員總數": lambda bot: f"`{cluster.total_members()}` 位",
+}
+
+# /help 指令的首頁
+HELP_HOME = _help_embed(
+    "🤖 幫助中心", "請點擊下方選單查看詳細指令。", discord.Color.from_rgb(44, 47, 51),
+    [(name, "`-`") for name in ("⏱️ 運行時間", "💓 延遲", "🏰 伺服器數", "👥 成員總數")], inline=True,
+)
+
+# 下拉選單各分類 (值 -> 範本)
+HELP_PAGES = {
+    "home": _help_embed(
+        "🤖 幫助中心", "請從下方選單選擇指令類別。", discord.Color.from_rgb(44, 47, 51), # 深色系
+        [(name, "`-`") for name in ("⏱️ 運行時間", "💓 系統延遲", "📚 指令總數", "🏰 伺服器數", "👥 成員總數")], inline=True,
+    ),
+    "tools": _help_embed("🛠️ 工具指令清單", "網路工具。", discord.Color.blue(), [
+        ("🌐 `/dns <domain>`", "查詢網域解析紀錄 (A, AAAA, CNAME, MX, TXT, NS, SOA)"),
+        ("🔍 `/ip <ip>`", "查詢 IP 地理位置與 ISP 資訊"),
+        ("📋 `/whois <domain>`", "查詢網域註冊商與到期日"),
+        ("🏓 `/ping`", "查看機器人延遲與伺服器硬體狀態"),
+    ]),
+    "info": _help_embed("ℹ️ 資訊查詢", "查看使用者、伺服器資訊與頭像", discord.Color.green(), [
+        ("👤 `/userinfo`", "查詢成員資訊"),
+        ("🏰 `/serverinfo`", "查詢伺服器資訊"),
+        ("🖼️ `/avatar`", "偷看頭像"),
+    ]),
+    "admin": _help_embed("🛡️ 管理員專用指令", "僅限管理員。", discord.Color.red(), [
+        ("🎫 `/ticket_setup [channel]`", "建立「開啟客服單」的按鈕面板"),
+        ("📦 `/bulk <file> [mode] [output]`", "上傳網域清單，批量查詢 DNS / WHOIS 並回傳 CSV/JSONL"),
+        ("🔎 `/transcript_search <query>`", "全文搜尋已歸檔的客服單對話紀錄"),
+        ("📈 `/stats`", "查看各指令的延遲統計 (p50/p95/p99)"),
+        ("🗑️ `/delete [count]`", "批量刪除指定數量的訊息"),
+        ("✏️ `/nick <member> <name>`", "強制修改成員暱稱"),
+        ("👢 `/kick <member>`", "踢出成員"),
+        ("🔨 `/ban <member>`", "封鎖成員"),
+    ]),
+}
+HELP_PAGES["home"].set_image(url=HELP_BANNER_URL)
+
+# 複製範本並填入目前的狀態
+def render_help_page(template, bot):
+    embed = template.copy()
+    for index, field in enumerate(template.fields):
+        render = HELP_DYNAMIC_FIELDS.get(field.name)
+        if render is not None:
+            embed.set_field_at(index, name=field.name, value=render(bot), inline=field.inline)
+    if template is HELP_HOME or template is HELP_PAGES["home"]:
+        embed.set_thumbnail(url=bot.user.display_avatar.url)
+    return embed
+
 class HelpSelect(Select):
-    def __init__(self, bot, bot_start_time):
-        self.bot = bot
-        self.bot_start_time = bot_start_time
-        
+    def __init__(self):
         options = [
-            discord.SelectOption(
-                label="🏠 首頁", 
-                description="查看機器人狀態與簡介", 
-                value="home", 
-                emoji="🏠"
-            ),
-            discord.SelectOption(
-                label="🛠️ 工具指令", 
-                description="DNS、IP、Whois、Ping 查詢工具", 
-                value="tools", 
-                emoji="🛠️"
-            ),
-            discord.SelectOption(
-                label="ℹ️ 資訊查詢", 
-                description="查看使用者、伺服器資訊與頭像", 
-                value="info", 
-                emoji="ℹ️"
-            ),
-            discord.SelectOption(
-                label="🛡️ 管理員指令", 
-                description="踢出、封鎖、刪除訊息、客服系統", 
-                value="admin", 
-                emoji="🛡️"
-            ),
-            
+            discord.SelectOption(label="🏠 首頁", description="查看機器人狀態與簡介", value="home", emoji="🏠"),
+            discord.SelectOption(label="🛠️ 工具指令", description="DNS、IP、Whois、Ping 查詢工具", value="tools", emoji="🛠️"),
+            discord.SelectOption(label="ℹ️ 資訊查詢", description="查看使用者、伺服器資訊與頭像", value="info", emoji="ℹ️"),
+            discord.SelectOption(label="🛡️ 管理員指令", description="踢出、封鎖、刪除訊息、客服系統", value="admin", emoji="🛡️"),
         ]
-        super().__init__(placeholder="請選擇您要查看的指令分類...", min_values=1, max_values=1, options=options)
+        super().__init__(placeholder="請選擇您要查看的指令分類...", min_values=1, max_values=1, options=options, custom_id="help_select")
 
     async def callback(self, interaction: discord.Interaction):
-        value = self.values[0]
-        
-        # --- 1. 首頁 Embed ---
-        if value == "home":
-            uptime = str(datetime.now() - self.bot_start_time).split('.')[0]
-            ping = round(self.bot.latency * 1000)
-            
-            embed = discord.Embed(
-                title="🤖 幫助中心",
-                description="請從下方選單選擇指令類別。",
-                color=discord.Color.from_rgb(44, 47, 51) # 深色系
-            )
-            embed.add_field(name="⏱️ 運行時間", value=f"`{uptime}`", inline=True)
-            embed.add_field(name="💓 系統延遲", value=f"`{ping} ms`", inline=True)
-            embed.add_field(name="📚 指令總數", value=f"`{len(self.bot.tree.get_commands())}` 個", inline=True)
-            
-            embed.set_thumbnail(url=self.bot.user.display_avatar.url)
-            embed.set_image(url="https://i.pinimg.com/736x/46/f5/b4/46f5b4064a5bf82b9d4af012313d2f95.jpg") # 您可以換成自己的橫幅圖，或刪除這行
-
-        # --- 2. 工具指令 Embed ---
-        elif value == "tools":
-            embed = discord.Embed(
-                title="🛠️ 工具指令清單",
-                description="網路工具。",
-                color=discord.Color.blue()
-            )
-            embed.add_field(
-                name="🌐 `/dns <domain>`", 
-                value="查詢網域解析紀錄 (A, CNAME, MX)", 
-                inline=False
-            )
-            embed.add_field(
-                name="🔍 `/ip <ip>`", 
-                value="查詢 IP 地理位置與 ISP 資訊", 
-                inline=False
-            )
-            embed.add_field(
-                name="📋 `/whois <domain>`", 
-                value="查詢網域註冊商與到期日", 
-                inline=False
-            )
-            embed.add_field(
-                name="🏓 `/ping`", 
-                value="查看機器人延遲與伺服器硬體狀態", 
-                inline=False
-            )
-        elif value == "info":
-            embed = discord.Embed(
-                title="ℹ️ 資訊查詢",
-                description="查看使用者、伺服器資訊與頭像",
-                color=discord.Color.green()
-            )
-            embed.add_field(
-                name="👤 `/userinfo`", 
-                value="查詢成員資訊", 
-                inline=False
-            )
-            embed.add_field(
-                name="🏰 `/serverinfo`", 
-                value="查詢伺服器資訊", 
-                inline=False
-            )
-            embed.add_field(
-                name="🖼️ `/avatar`", 
-                value="偷看頭像", 
-                inline=False
-            )
-
-        # --- 3. 管理員指令 Embed ---
-        elif value == "admin":
-            embed = discord.Embed(
-                title="🛡️ 管理員專用指令",
-                description="僅限管理員。",
-                color=discord.Color.red()
-            )
-            embed.add_field(
-                name="🎫 `/ticket_setup [channel]`", 
-                value="建立「開啟客服單」的按鈕面板", 
-                inline=False
-            )
-            embed.add_field(
-                name="🗑️ `/delete [count]`", 
-                value="批量刪除指定數量的訊息", 
-                inline=False
-            )
-            embed.add_field(
-                name="✏️ `/nick <member> <name>`", 
-                value="強制修改成員暱稱", 
-                inline=False
-            )
-            embed.add_field(
-                name="👢 `/kick <member>`", 
-                value="踢出成員", 
-                inline=False
-            )
-            embed.add_field(
-                name="🔨 `/ban <member>`", 
-                value="封鎖成員", 
-                inline=False
-            )
-
+        embed = render_help_page(HELP_PAGES[self.values[0]], interaction.client)
         embed.set_footer(text=f"由 {interaction.user.display_name} 查詢 • {datetime.now().strftime('%H:%M')}", icon_url=interaction.user.display_avatar.url)
-        
-        await interaction.response.edit_message(embed=embed, view=self.view)
+        # 選單本身不變，只更新 Embed
+        await interaction.response.edit_message(embed=embed)
 
+# 常駐的 Help 選單：啟動時以 add_view 註冊一次，所有 /help 訊息共用 (依 custom_id 分派)
 class HelpView(View):
-    def __init__(self, bot, bot_start_time):
-        super().__init__(timeout=60) # 60秒後選單失效
-        self.add_item(HelpSelect(bot, bot_start_time))
-        
-    async def on_timeout(self):
-        # 超時後鎖定選單，提示使用者重新輸入指令
-        for item in self.children:
-            item.disabled = True
-        # 注意：這裡無法編輯原本的訊息，除非我們有儲存 message 物件，
-        # 但通常為了簡單起見，讓它單純失效即可。
-
-def setup_commands(tree, bot_start_time):
+    def __init__(self):
+        super().__init__(timeout=None)
+        self.add_item(HelpSelect())
+
+def setup_commands(tree):
     bot = tree.client
+    # 送出訊息用的選單：先停止，送出時就不會再加入 view store (互動由已註冊的 HelpView 處理)
+    help_components = HelpView()
+    help_components.stop()
 
     # --- /help ---
     @tree.command(name="help", description="開啟互動式幫助選單")
+    @metrics.instrument("help")
     async def help_command(interaction: discord.Interaction):
         error.log_command(interaction, "help", "開啟互動選單", bot)
         
-        # 預設顯示首頁 Embed
-        uptime = str(datetime.now() - bot_start_time).split('.')[0]
-        embed = discord.Embed(
-            title="🤖 幫助中心",
-            description="請點擊下方選單查看詳細指令。",
-            color=discord.Color.from_rgb(44, 47, 51)
-        )
-        embed.add_field(name="⏱️ 運行時間", value=f"`{uptime}`", inline=True)
-        embed.add_field(name="💓 延遲", value=f"`{round(bot.latency * 1000)} ms`", inline=True)
-        embed.set_thumbnail(url=bot.user.display_avatar.url)
-        
-        # 發送 Embed 與 View (下拉選單)
-        view = HelpView(bot, bot_start_time)
-        await interaction.response.send_message(embed=embed, view=view)
+        # 預設顯示首頁 Embed 與下拉選單
+        embed = render_help_page(HELP_HOME, bot)
+        await interaction.response.send_message(embed=embed, view=help_components)
 
     # --- /dns ---
     @tree.command(name="dns", description="查詢 DNS 紀錄")
+    @metrics.instrument("dns")
     async def dns_command(interaction: discord.Interaction, host: str, ephemeral: bool = True):
         await interaction.response.defer()
         error.log_command(interaction, "dns", f"{host}", bot)
@@ -203,32 +164,26 @@ def setup_commands(tree, bot_start_time):
 
         embed = discord.Embed(title="🌐 DNS 解析結果", description=f"目標: `{host}`", color=discord.Color.green(), timestamp=datetime.now())
         
-        try:
-            a_records = dns.resolver.resolve(host, 'A')
-            embed.add_field(name="📌 A Record", value="\n".join([r.address for r in a_records]), inline=False)
-        except Exception:
-            embed.add_field(name="📌 A Record", value="❌ 無 A 紀錄", inline=False)
-        
-        try:
-            cname_records = dns.resolver.resolve(host, 'CNAME')
-            embed.add_field(name="🔗 CNAME", value="\n".join([str(r.target) for r in cname_records]), inline=False)
-        except Exception:
-            embed.add_field(name="🔗 CNAME", value="❌ 無 CNAME 紀錄", inline=False)
-            
-        try:
-            mx_records = dns.resolver.resolve(host, 'MX')
-            embed.add_field(name="📧 MX Record", value="\n".join([f"{r.preference}: {r.exchange}" for r in mx_records]), inline=False)
-        except Exception:
-            embed.add_field(name="📧 MX Record", value="❌ 無 MX 紀錄", inline=False)
+        # 所有紀錄同時查詢，總耗時取決於最慢的單一查詢
+        with metrics.external("dns"):
+            results = await utils.resolve_all(host)
+        for rdtype, label in DNS_FIELD_LABELS.items():
+            records = results.get(rdtype)
+            if records:
+                value = "\n".join(utils.format_dns_record(rdtype, r) for r in records)
+                if len(value) > 1000: value = value[:1000] + "..." # 防止超過 Embed 欄位上限
+            else:
+                value = f"❌ 無 {rdtype} 紀錄"
+            embed.add_field(name=label, value=value, inline=False)
 
         msg = await interaction.followup.send(embed=embed)
         if ephemeral:
-            await asyncio.sleep(25) 
-            try: await msg.delete()
-            except: pass
+            # 交給 discord.py 在背景延遲刪除，指令本身不必再等待 25 秒
+            await msg.delete(delay=25)
 
     # --- /ip ---
     @tree.command(name="ip", description="查詢 IP 詳細資訊")
+    @metrics.instrument("ip")
     async def ip_command(interaction: discord.Interaction, ip: str, ephemeral: bool = True):
         await interaction.response.defer()
         error.log_command(interaction, "ip", ip, bot)
@@ -245,14 +200,14 @@ def setup_commands(tree, bot_start_time):
                 error.log_warning(interaction, f"嘗試查詢受限 IP: {ip}", bot)
                 return
 
-            data = await utils.get_ip_info(ip)
+            with metrics.external("ip-api"):
+                data = await utils.get_ip_info(ip)
             if data and data.get("status") == "success":
                 embed = discord.Embed(title=f"🔍 IP 詳細資訊: {ip}", color=discord.Color.blue())
                 embed.add_field(name="🌍 國家", value=data.get("country", "未知"), inline=True)
                 embed.add_field(name="🏙️ 城市", value=data.get("city", "未知"), inline=True)
                 embed.add_field(name="🏢 ISP", value=data.get("isp", "未知"), inline=False)
                 embed.add_field(name="🔄 反向 DNS", value=f"`{data.get('reverse', '無')}`", inline=False)
-                await interaction.followup.send(embed=embed)
             else:
                 raise ValueError(f"API 回傳錯誤: {data.get('message', '未知')}")
         except Exception as e:
@@ -260,12 +215,12 @@ def setup_commands(tree, bot_start_time):
         
         msg = await interaction.followup.send(embed=embed)
         if ephemeral:
-            await asyncio.sleep(25) 
-            try: await msg.delete()
-            except: pass
+            # 交給 discord.py 在背景延遲刪除，指令本身不必再等待 25 秒
+            await msg.delete(delay=25)
 
     # --- /whois ---
     @tree.command(name="whois", description="查詢網域註冊資訊")
+    @metrics.instrument("whois")
     async def whois_command(interaction: discord.Interaction, domain: str, ephemeral: bool = True):
         await interaction.response.defer()
         target = utils.clean_domain(domain.strip().lower())
@@ -277,55 +232,72 @@ def setup_commands(tree, bot_start_time):
             return
             
         try:
-            loop = asyncio.get_event_loop()
-            w = await loop.run_in_executor(None, whois.whois, target)
+            # 經由 WHOIS 專用執行緒池查詢，並優先讀取持久化快取
+            with metrics.external("whois"):
+                w = await utils.get_whois_info(target)
             embed = discord.Embed(title=f"📋 WHOIS 查詢結果: {target}", color=discord.Color.purple(), timestamp=datetime.now())
-            embed.add_field(name="🏢 註冊商", value=w.registrar or "未知", inline=False)
-            embed.add_field(name="📅 註冊日期", value=utils.format_whois_date(w.creation_date), inline=True)
-            embed.add_field(name="⏳ 到期日期", value=utils.format_whois_date(w.expiration_date), inline=True)
-            ns = "\n".join(w.name_servers) if isinstance(w.name_servers, list) else (w.name_servers or "未知")
+            embed.add_field(name="🏢 註冊商", value=w["registrar"] or "未知", inline=False)
+            embed.add_field(name="📅 註冊日期", value=utils.format_whois_date(w["creation_date"]), inline=True)
+            embed.add_field(name="⏳ 到期日期", value=utils.format_whois_date(w["expiration_date"]), inline=True)
+            ns = "\n".join(w["name_servers"]) if w["name_servers"] else "未知"
             embed.add_field(name="🌐 名稱伺服器 (NS)", value=f"```\n{ns}\n```", inline=False)
-            await interaction.followup.send(embed=embed)
         except Exception as e:
             raise e
         
         msg = await interaction.followup.send(embed=embed)
         if ephemeral:
-            await asyncio.sleep(25) 
-            try: await msg.delete()
-            except: pass
+            # 交給 discord.py 在背景延遲刪除，指令本身不必再等待 25 秒
+            await msg.delete(delay=25)
     # --- /ping ---
     @tree.command(name="ping", description="查看延遲與系統狀態")
+    @metrics.instrument("ping")
     async def ping_command(interaction: discord.Interaction):
         error.log_command(interaction, "ping", "系統狀態查詢", bot)
         start_time = time.time()
         await interaction.response.send_message("🏓 讀取中...")
         end_time = time.time()
 
-        uptime = str(datetime.now() - bot_start_time).split('.')[0]
-        cpu_usage = psutil.cpu_percent(interval=None)
-        ram_usage = psutil.virtual_memory().percent
-        gpu_data = utils.get_gpu_info()
-        disks_data = utils.get_disk_info()
+        uptime = format_uptime(bot)
+        # 讀取背景取樣的最新快照；機器人剛啟動尚無資料時才在執行緒中即時取樣一次
+        snapshot = monitor.system_sampler.latest() or await asyncio.to_thread(monitor.system_sampler.sample)
+        history = monitor.system_sampler.history(PING_HISTORY_MINUTES)
 
         embed = discord.Embed(title="🖥️ 系統儀表板", color=discord.Color.blue(), timestamp=datetime.now())
         embed.add_field(name="💓 延遲", value=f"`{round(tree.client.latency * 1000)}ms`", inline=True)
         embed.add_field(name="⏱️ 運行", value=f"`{uptime}`", inline=True)
-        embed.add_field(name="📊 CPU", value=utils.create_progress_bar(cpu_usage), inline=False)
-        embed.add_field(name="💾 RAM", value=utils.create_progress_bar(ram_usage), inline=False)
 
-        if disks_data:
-            for disk in disks_data:
+        for key, label in (("cpu", "📊 CPU"), ("ram", "💾 RAM")):
+            value = utils.create_progress_bar(snapshot[key])
+            values = [s[key] for s in history]
+            trend = monitor.summarize(values)
+            if trend and len(values) > 1:
+                value += (f"\n`{monitor.sparkline(values)}`\n"
+                          f"近 {PING_HISTORY_MINUTES} 分鐘 最低 `{trend['min']:.0f}%` • 平均 `{trend['avg']:.0f}%` • 最高 `{trend['max']:.0f}%`")
+            embed.add_field(name=label, value=value, inline=False)
+
+        if snapshot["disks"]:
+            for disk in snapshot["disks"]:
                 embed.add_field(name=f"💽 {disk['label']}", value=f"{utils.create_progress_bar(disk['percent'])}\n{disk['used']}/{disk['total']} GB", inline=False)
         
+        gpu_data = snapshot["gpu"]
         if gpu_data:
             embed.add_field(name=f"🎮 {gpu_data['name']}", value=f"負載: {utils.create_progress_bar(gpu_data['load'])}\n溫度: `{gpu_data['temp']}°C`", inline=False)
 
+        for cache_name, cache in (("DNS", utils.dns_cache), ("IP", utils.ip_cache), ("成員", utils.member_cache)):
+            cache_stats = cache.stats()
+            embed.add_field(
+                name=f"🗂️ {cache_name} 快取",
+                value=f"命中率: `{cache_stats['hit_rate']:.1f}%` ({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']})\n"
+                      f"項目: `{cache_stats['size']}/{cache_stats['max_entries']}` • 淘汰: `{cache_stats['evictions']}`",
+                inline=False
+            )
+
         await interaction.edit_original_response(content=None, embed=embed)
 
     # --- /userinfo ---
     @tree.command(name="userinfo", description="查看成員詳細資訊 (註冊日、加入日、身分組)")
     @app_commands.describe(member="選擇要查詢的成員 (預設為自己)")
+    @metrics.instrument("userinfo")
     async def userinfo_command(interaction: discord.Interaction, member: discord.Member = None):
         target = member or interaction.user
         
@@ -355,6 +327,7 @@ def setup_commands(tree, bot_start_time):
 
     # --- /serverinfo ---
     @tree.command(name="serverinfo", description="查看本伺服器詳細資訊")
+    @metrics.instrument("serverinfo")
     async def serverinfo_command(interaction: discord.Interaction):
         guild = interaction.guild
         
@@ -362,26 +335,31 @@ def setup_commands(tree, bot_start_time):
         if guild.icon:
             embed.set_thumbnail(url=guild.icon.url)
         
-        # 統計人數
-        total = guild.member_count
-        bots = len([m for m in guild.members if m.bot])
-        humans = total - bots
+        # 讀取事件維護的統計，不走訪成員清單 (低記憶體模式下無法區分人類與機器人，只顯示總數)
+        stats = guild_stats.guild_stats.get(guild)
+        member_stats = f"總數: **{stats.members}**"
+        if stats.bots is not None:
+            member_stats += f"\n人類: **{stats.humans}**\n機器人: **{stats.bots}**"
+        channel_stats = "\n".join(f"{label}: **{stats.channel_count(*types)}**" for label, types in guild_stats.CHANNEL_GROUPS.items())
         
-        embed.add_field(name="👑 擁有者", value=guild.owner.mention, inline=True)
+        # 擁有者不一定在快取中，直接以 ID 標記
+        embed.add_field(name="👑 擁有者", value=f"<@{guild.owner_id}>", inline=True)
         embed.add_field(name="🆔 ID", value=f"`{guild.id}`", inline=True)
         embed.add_field(name="🌍 地區/等級", value=f"Level {guild.premium_tier}", inline=True)
         
         created_at = int(guild.created_at.timestamp())
         embed.add_field(name="📅 成立時間", value=f"<t:{created_at}:D> (<t:{created_at}:R>)", inline=False)
         
-        embed.add_field(name="👥 成員統計", value=f"總數: **{total}**\n人類: **{humans}**\n機器人: **{bots}**", inline=True)
-        embed.add_field(name="📺 頻道統計", value=f"文字: **{len(guild.text_channels)}**\n語音: **{len(guild.voice_channels)}**", inline=True)
+        embed.add_field(name="👥 成員統計", value=member_stats, inline=True)
+        embed.add_field(name="📺 頻道統計", value=channel_stats, inline=True)
+        embed.add_field(name="🎭 身分組", value=f"**{stats.roles}** 個", inline=True)
         
         await interaction.response.send_message(embed=embed)
 
     # --- /avatar ---
     @tree.command(name="avatar", description="獲取使用者的高清頭像")
     @app_commands.describe(member="選擇成員 (預設為自己)")
+    @metrics.instrument("avatar")
     async def avatar_command(interaction: discord.Interaction, member: discord.Member = None):
         target = member or interaction.user
         
@@ -403,6 +381,7 @@ def setup_commands(tree, bot_start_time):
     @tree.command(name="ticket_setup", description="[管理員] 發送客服單建立面板")
     @app_commands.describe(channel="請選擇要發送面板的頻道 (若不選則發送至當前頻道)")
     @app_commands.default_permissions(administrator=True)
+    @metrics.instrument("ticket_setup")
     async def ticket_setup_command(interaction: discord.Interaction, channel: discord.TextChannel = None):
         target_channel = channel or interaction.channel
         error.log_command(interaction, "ticket_setup", f"建立面板於 #{target_channel.name}", bot)
@@ -425,10 +404,103 @@ def setup_commands(tree, bot_start_time):
             error.logger.error(f"發送面板失敗: {e}")
             await interaction.response.send_message(f"❌ 發送失敗: {e}", ephemeral=True)
 
+    # --- /bulk ---
+    @tree.command(name="bulk", description="[管理員] 上傳網域清單批量查詢 DNS / WHOIS")
+    @app_commands.describe(file="每行一個網域的 .txt 或 .csv 檔 (CSV 取第一欄)", mode="查詢類型", output="輸出格式")
+    @app_commands.choices(
+        mode=[app_commands.Choice(name="DNS", value="dns"), app_commands.Choice(name="WHOIS", value="whois")],
+        output=[app_commands.Choice(name="CSV", value="csv"), app_commands.Choice(name="JSONL", value="jsonl")]
+    )
+    @app_commands.default_permissions(administrator=True)
+    @metrics.instrument("bulk")
+    async def bulk_command(interaction: discord.Interaction, file: discord.Attachment, mode: str = "dns", output: str = "csv"):
+        await interaction.response.defer()
+        error.log_command(interaction, "bulk", f"{mode.upper()} 清單 {file.filename} ({file.size} bytes)", bot)
+
+        # 所有進度都編輯同一則訊息，避免洗版
+        progress_msg = await interaction.followup.send(f"⏳ 批量 {mode.upper()} 查詢開始...")
+
+        async def on_progress(stats):
+            await progress_msg.edit(content=f"⏳ 批量 {mode.upper()} 查詢中... 已完成 **{stats['done']}** / 已讀取 **{stats['read']}** 筆 (失敗 {stats['errors']} 筆)")
+
+        path, stats = await bulk.run_bulk(file.url, mode, output, on_progress)
+        content = f"✅ 批量 {mode.upper()} 查詢完成：共 **{stats['done']}** 筆，失敗 **{stats['errors']}** 筆。"
+        if stats["truncated"]:
+            content += f"\n⚠️ 清單超過上限 {bulk.BULK_MAX_DOMAINS} 筆，只處理了前 {bulk.BULK_MAX_DOMAINS} 筆，其餘網域未包含在結果中。"
+        try:
+            await progress_msg.edit(
+                content=content,
+                attachments=[discord.File(path)]
+            )
+        finally:
+            os.remove(path)
+
+    # --- /transcript_search ---
+    @tree.command(name="transcript_search", description="[管理員] 全文搜尋客服單對話紀錄")
+    @app_commands.describe(query="關鍵字 (以空白分隔多個關鍵字，需全部符合)")
+    @app_commands.default_permissions(administrator=True)
+    @metrics.instrument("transcript_search")
+    async def transcript_search(interaction: discord.Interaction, query: str):
+        error.log_command(interaction, "transcript_search", query, bot)
+
+        start = time.perf_counter()
+        hits = await transcripts.transcript_index.search(query, limit=10)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        embed = discord.Embed(title=f"🔎 對話紀錄搜尋：{query[:200]}", color=discord.Color.blurple())
+        for hit in hits:
+            embed.add_field(
+                name=f"#{hit['channel']} • {hit['time']} • {hit['author']}"[:256],
+                value=f"{hit['snippet'][:900]}\n`{hit['path']}`",
+                inline=False
+            )
+        if not hits:
+            embed.description = "找不到符合的紀錄 (每個關鍵字至少需 3 個字元)。"
+        embed.set_footer(text=f"搜尋耗時 {elapsed:.1f} ms")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    # --- /stats ---
+    @tree.command(name="stats", description="[管理員] 查看各指令的延遲統計 (p50/p95/p99)")
+    @app_commands.default_permissions(administrator=True)
+    @metrics.instrument("stats")
+    async def stats_command(interaction: discord.Interaction):
+        error.log_command(interaction, "stats", "指令延遲統計", bot)
+
+        embed = discord.Embed(title="📈 指令延遲統計", description="各階段耗時 p50 / p95 / p99 (毫秒)，依總耗時 p95 排序", color=discord.Color.teal(), timestamp=datetime.now())
+
+        # 叢集模式下為所有行程合併後的統計
+        sketches, errors = cluster.command_sketches(), cluster.command_errors()
+        summary = cluster.cluster_client.summary
+        footer = f"{cluster.total_guilds(bot)} 個伺服器 • {cluster.total_members()} 位成員"
+        if summary:
+            footer = f"{summary['clusters']} 個叢集 • {summary['shards']} 個分片 • " + footer
+        embed.set_footer(text=footer)
+
+        # 依總耗時 p95 由慢到快排序 (Embed 最多 25 個欄位)
+        rows = sorted(sketches.items(), key=lambda item: item[1]["total"].quantile(0.95), reverse=True)
+        for name, phases in rows[:25]:
+            lines = []
+            for phase, label in STATS_PHASE_LABELS.items():
+                sketch = phases.get(phase)
+                if not sketch: continue
+                p50, p95, p99 = (round(sketch.quantile(q) * 1000) for q in (0.5, 0.95, 0.99))
+                lines.append(f"{label}: `{p50} / {p95} / {p99}`")
+            embed.add_field(
+                name=f"/{name} • {phases['total'].count} 次 • 錯誤 {errors.get(name, 0)} 次",
+                value="\n".join(lines),
+                inline=False
+            )
+
+        if not rows:
+            embed.description = "目前尚無資料。"
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     # --- /nick ---
     @tree.command(name="nick", description="[管理員] 修改成員暱稱")
     @app_commands.describe(member="選擇成員", name="新的暱稱")
     @app_commands.default_permissions(administrator=True)
+    @metrics.instrument("nick")
     async def nick_command(interaction: discord.Interaction, member: discord.Member, name: str):
         error.log_command(interaction, "nick", f"修改 {member} -> {name}", bot)
 
@@ -447,6 +519,7 @@ def setup_commands(tree, bot_start_time):
     @tree.command(name="kick", description="[管理員] 踢出成員")
     @app_commands.describe(member="選擇成員", reason="踢出原因 (選填)")
     @app_commands.default_permissions(administrator=True)
+    @metrics.instrument("kick")
     async def kick_command(interaction: discord.Interaction, member: discord.Member, reason: str = "未提供原因"):
         error.log_command(interaction, "kick", f"踢出 {member} 原因: {reason}", bot)
 
@@ -467,6 +540,7 @@ def setup_commands(tree, bot_start_time):
     @tree.command(name="ban", description="[管理員] 封鎖成員")
     @app_commands.describe(member="選擇成員", reason="封鎖原因 (選填)")
     @app_commands.default_permissions(administrator=True)
+    @metrics.instrument("ban")
     async def ban_command(interaction: discord.Interaction, member: discord.Member, reason: str = "未提供原因"):
         error.log_command(interaction, "ban", f"封鎖 {member} 原因: {reason}", bot)
 
@@ -487,6 +561,7 @@ def setup_commands(tree, bot_start_time):
     @tree.command(name="delete", description="[管理員] 批量刪除訊息")
     @app_commands.describe(count="要刪除的訊息數量 (預設 5)")
     @app_commands.default_permissions(manage_messages=True) # 權限限制
+    @metrics.instrument("delete")
     async def delete_command(interaction: discord.Interaction, count: int = 5):
         # 1. 記錄日誌
         error.log_command(interaction, "delete", f"刪除 {count} 條訊息", bot)
@@ -1,7 +1,15 @@
 import os
+import gzip
+import json
+import time
+import queue
+import atexit
+import shutil
+import asyncio
 import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
 import discord
-import aiohttp
+import http_client
 import traceback
 from datetime import datetime
 from dotenv import load_dotenv
@@ -10,62 +18,226 @@ from dotenv import load_dotenv
 load_dotenv()
 WEBHOOK_URL = os.getenv('LOG_WEBHOOK_URL')
 
-# --- 自動建立 log 資料夾 ---
+# --- log 資料夾 (於 setup_logging 時自動建立) ---
 LOG_DIR = "log"
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
-    print(f"📁 已建立日誌資料夾: {LOG_DIR}/")
+
+# --- 日誌設定 ---
+# 依大小輪替 (位元組)；若設定 LOG_ROTATE_WHEN (例如 midnight、H) 則改為依時間輪替
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')
+# 保留的舊日誌數量 (舊檔會以 gzip 壓縮)
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 14))
+# 檔案日誌格式：text (一般文字) / json (每行一筆 JSON)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+
+# JSON Lines 格式，方便之後以程式分析
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record, '%Y-%m-%d %H:%M:%S'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        return json.dumps(data, ensure_ascii=False)
+
+# 輪替時將舊檔壓縮成 .gz
+def _gzip_namer(name):
+    return name + ".gz"
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
 
 # --- 初始化 Logger ---
 logger = logging.getLogger('discord_bot')
 logger.setLevel(logging.INFO)
 formatter = logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s', '%Y-%m-%d %H:%M:%S')
 
-# 檔案處理器：路徑指向 log/bot.log
-file_handler = logging.FileHandler(os.path.join(LOG_DIR, 'bot.log'), encoding='utf-8')
-file_handler.setFormatter(formatter)
+# 檔案處理器：路徑指向 log/bot.log，超過大小或時間後輪替並壓縮
+# cluster.py 啟動的每個行程各自寫入 bot-cluster<N>.log，避免多個行程同時輪替同一個檔案
+CLUSTER_ID = os.getenv('CLUSTER_ID')
+log_path = os.path.join(LOG_DIR, f'bot-cluster{CLUSTER_ID}.log' if CLUSTER_ID else 'bot.log')
 
-# 控制台處理器
-stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(formatter)
+# 指令處理中只把紀錄放進佇列，實際的檔案/控制台寫入由背景執行緒負責，不阻塞事件迴圈；
+# setup_logging 之前產生的紀錄會先留在佇列中，啟動後再一併寫出
+log_queue = queue.SimpleQueue()
+logger.addHandler(QueueHandler(log_queue))
+log_listener = None
 
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
+# 建立 log 資料夾與檔案/控制台處理器 (由 bot.main / cluster.main 啟動時呼叫)；
+# 匯入本模組不會建立檔案或輸出訊息
+def setup_logging():
+    global log_listener
+    if log_listener is not None: return
 
-# 啟動時檢查 Webhook 狀態
-if WEBHOOK_URL:
-    print(f"✅ Webhook URL 已載入: {WEBHOOK_URL[:10]}...")
-else:
-    print("⚠️ 警告: 未偵測到 LOG_WEBHOOK_URL")
+    if not os.path.exists(LOG_DIR):
+        os.makedirs(LOG_DIR)
+        print(f"📁 已建立日誌資料夾: {LOG_DIR}/")
 
-# --- 基礎 Webhook 發送功能 ---
-async def send_webhook_log(message, level="INFO"):
-    if not WEBHOOK_URL: return
-    
+    if LOG_ROTATE_WHEN:
+        file_handler = TimedRotatingFileHandler(log_path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    else:
+        file_handler = RotatingFileHandler(log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    file_handler.namer = _gzip_namer
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else formatter)
+
+    # 控制台處理器
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+    # 啟動時檢查 Webhook 狀態
+    if WEBHOOK_URL:
+        print(f"✅ Webhook URL 已載入: {WEBHOOK_URL[:10]}...")
+    else:
+        print("⚠️ 警告: 未偵測到 LOG_WEBHOOK_URL")
+
+# --- Webhook 批次發送設定 ---
+# 佇列上限與滿載時的處理方式：drop_oldest (丟棄最舊的紀錄) / drop_new (丟棄新進的紀錄)
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))
+WEBHOOK_OVERFLOW_POLICY = os.getenv('WEBHOOK_OVERFLOW_POLICY', 'drop_oldest')
+# 收集同一批紀錄的等待時間 (秒)
+WEBHOOK_BATCH_WINDOW = float(os.getenv('WEBHOOK_BATCH_WINDOW', 2))
+# 遇到 429 時的重試次數
+WEBHOOK_MAX_RETRIES = 5
+# Discord Webhook 限制：每則訊息最多 10 個 Embed，所有 Embed 文字合計 6000 字元
+WEBHOOK_MAX_EMBEDS = 10
+WEBHOOK_MAX_CHARS = 6000
+BOT_NAME = "系統監控助手"
+
+# --- 基礎 Webhook 日誌格式 ---
+def build_log_embed(message, level="INFO"):
     clean_message = (message[:3800] + '\n...(內容過長已截斷)') if len(message) > 3800 else message
-    BOT_NAME = "系統監控助手"
     
     color = 0x3498db # INFO: 藍色
     if level == "ERROR": color = 0xe74c3c # 紅色
     elif level == "WARNING": color = 0xf1c40f # 黃色
 
-    payload = {
-        "username": BOT_NAME,
-        "embeds": [{
-            "title": f"📊 系統日誌 - {level}",
-            "description": f"```python\n{clean_message}\n```",
-            "color": color,
-            "footer": {"text": f"時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"}
-        }]
+    return {
+        "title": f"📊 系統日誌 - {level}",
+        "description": f"```python\n{clean_message}\n```",
+        "color": color,
+        "footer": {"text": f"時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"}
     }
 
-    async with aiohttp.ClientSession() as session:
+def _embed_size(embed):
+    return len(embed["title"]) + len(embed["description"]) + len(embed["footer"]["text"])
+
+# --- Webhook 背景發送器 ---
+# 日誌先放入有上限的佇列，由單一背景工作合併成一次 Webhook 請求 (最多 10 個 Embed)，
+# 並依 Discord 回傳的 retry_after 與速率限制標頭控制發送節奏
+class WebhookShipper:
+    def __init__(self, url):
+        self.url = url
+        self.queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+        self.stats = {"enqueued": 0, "sent": 0, "batches": 0, "dropped": 0, "retries": 0, "failed": 0}
+        self._worker = None
+        self._carry = None
+        self._busy = False
+        self._blocked_until = 0.0
+
+    def enqueue(self, message, level="INFO"):
+        if not self.url: return
+        if self.queue.full():
+            self.stats["dropped"] += 1
+            if WEBHOOK_OVERFLOW_POLICY == "drop_new":
+                return
+            self.queue.get_nowait()
+        self.queue.put_nowait(build_log_embed(message, level))
+        self.stats["enqueued"] += 1
+
+    def start(self):
+        if self.url and (self._worker is None or self._worker.done()):
+            self._worker = asyncio.create_task(self._run())
+
+    # 關閉前盡量送出佇列中剩餘的紀錄
+    async def stop(self, timeout=5):
+        if self._worker is None: return
         try:
-            async with session.post(WEBHOOK_URL, json=payload) as resp:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._worker.cancel()
+        try: await self._worker
+        except asyncio.CancelledError: pass
+        self._worker = None
+
+    async def _drain(self):
+        while not self.queue.empty() or self._carry or self._busy:
+            await asyncio.sleep(0.1)
+
+    async def _collect(self):
+        first = self._carry or await self.queue.get()
+        self._carry = None
+        self._busy = True
+        batch, size = [first], _embed_size(first)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + WEBHOOK_BATCH_WINDOW
+        while len(batch) < WEBHOOK_MAX_EMBEDS:
+            try:
+                embed = await asyncio.wait_for(self.queue.get(), max(0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                break
+            if size + _embed_size(embed) > WEBHOOK_MAX_CHARS:
+                # 超過單則訊息的字數上限，留到下一批
+                self._carry = embed
+                break
+            batch.append(embed)
+            size += _embed_size(embed)
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                await self._send(batch)
+            except Exception as e:
+                self.stats["failed"] += len(batch)
+                print(f"Webhook 連線異常: {e}")
+            finally:
+                self._busy = False
+
+    async def _send(self, embeds):
+        payload = {"username": BOT_NAME, "embeds": embeds}
+        for _ in range(WEBHOOK_MAX_RETRIES):
+            wait = self._blocked_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            session = http_client.get_session()
+            async with session.post(self.url, json=payload) as resp:
+                # 依速率限制標頭，在額度用盡時暫停到重置為止
+                if resp.headers.get('X-RateLimit-Remaining') == '0':
+                    self._blocked_until = time.monotonic() + float(resp.headers.get('X-RateLimit-Reset-After', 1))
+
+                if resp.status == 429:
+                    data = await resp.json(content_type=None)
+                    self._blocked_until = time.monotonic() + float(data.get('retry_after', 1))
+                    self.stats["retries"] += 1
+                    continue
                 if resp.status not in [200, 204]:
+                    self.stats["failed"] += len(embeds)
                     print(f"Webhook 發送失敗: {resp.status}")
-        except Exception as e:
-            print(f"Webhook 連線異常: {e}")
+                    return
+                self.stats["sent"] += len(embeds)
+                self.stats["batches"] += 1
+                return
+
+        self.stats["failed"] += len(embeds)
+        print(f"Webhook 發送失敗: 已重試 {WEBHOOK_MAX_RETRIES} 次仍遭速率限制")
+
+webhook_shipper = WebhookShipper(WEBHOOK_URL)
+
+# --- 基礎 Webhook 發送功能 (放入佇列後立即返回) ---
+def send_webhook_log(message, level="INFO"):
+    webhook_shipper.enqueue(message, level)
 
 # --- 一般指令記錄 (Info Log) ---
 def log_command(interaction: discord.Interaction, command_name: str, details: str, bot=None):
@@ -76,7 +248,7 @@ def log_command(interaction: discord.Interaction, command_name: str, details: st
     logger.info(f"[CMD] {log_msg}")
     
     if bot and WEBHOOK_URL:
-        bot.loop.create_task(send_webhook_log(log_msg, "INFO"))
+        send_webhook_log(log_msg, "INFO")
 
 # --- 警告記錄 (Warning Log) ---
 def log_warning(interaction: discord.Interaction, details: str, bot=None):
@@ -92,7 +264,7 @@ def log_warning(interaction: discord.Interaction, details: str, bot=None):
             f"👤 **使用者**: `{user}`\n"
             f"📝 **詳情**: {details}"
         )
-        bot.loop.create_task(send_webhook_log(report, "WARNING"))
+        send_webhook_log(report, "WARNING")
 
 # --- 錯誤處理核心 (Error Handler) ---
 async def handle_command_error(interaction: discord.Interaction, error, bot=None):
@@ -114,7 +286,7 @@ async def handle_command_error(interaction: discord.Interaction, error, bot=None
             f"📍 **位置**: `{interaction.guild.name if interaction.guild else '私訊'}`\n"
             f"```python\n{short_error}\n```"
         )
-        await send_webhook_log(report, "ERROR")
+        send_webhook_log(report, "ERROR")
 
     # 回覆使用者
     try:
@@ -0,0 +1,111 @@
+import discord
+
+# --- 伺服器統計 ---
+# 每個伺服器的成員/頻道/身分組數量，初次使用時由快取計算一次，
+# 之後只依成員加入/離開、頻道與身分組的建立/刪除事件增減，查詢時不需走訪成員清單
+class GuildStats:
+    def __init__(self, guild):
+        self.members = guild.member_count or 0
+        # 成員清單未完整載入時 (例如低記憶體模式) 無法區分人類與機器人
+        if guild.chunked:
+            self.bots = sum(1 for m in guild.members if m.bot)
+        else:
+            self.bots = None
+        self.channels = {}
+        for channel in guild.channels:
+            self.add_channel(channel.type)
+        self.roles = len(guild.roles)
+
+    @property
+    def humans(self):
+        return None if self.bots is None else self.members - self.bots
+
+    def channel_count(self, *types):
+        return sum(self.channels.get(t, 0) for t in types)
+
+    def add_channel(self, channel_type, delta=1):
+        self.channels[channel_type] = self.channels.get(channel_type, 0) + delta
+
+class GuildStatsStore:
+    def __init__(self):
+        self._stats = {}
+        # 所有伺服器的成員總數 (與各伺服器的統計同步增減)
+        self.total_members = 0
+
+    # 取得統計，尚未建立時立即計算 (只有第一次是 O(成員數))
+    def get(self, guild):
+        stats = self._stats.get(guild.id)
+        if stats is None:
+            stats = self.seed(guild)
+        return stats
+
+    def seed(self, guild):
+        self.remove_guild(guild.id)
+        stats = self._stats[guild.id] = GuildStats(guild)
+        self.total_members += stats.members
+        return stats
+
+    def rebuild(self, guilds):
+        self._stats = {}
+        self.total_members = 0
+        for guild in guilds:
+            self.seed(guild)
+
+    def remove_guild(self, guild_id):
+        stats = self._stats.pop(guild_id, None)
+        if stats is not None:
+            self.total_members -= stats.members
+
+    # --- 事件 ---
+    def member_joined(self, member):
+        stats = self._stats.get(member.guild.id)
+        if stats is None: return
+        stats.members += 1
+        self.total_members += 1
+        if stats.bots is not None and member.bot:
+            stats.bots += 1
+
+    # on_raw_member_remove：成員不在快取中時也會觸發
+    def member_left(self, guild_id, user):
+        stats = self._stats.get(guild_id)
+        if stats is None: return
+        stats.members -= 1
+        self.total_members -= 1
+        if stats.bots is not None and user.bot:
+            stats.bots -= 1
+
+    def channel_created(self, channel):
+        stats = self._stats.get(channel.guild.id)
+        if stats is not None:
+            stats.add_channel(channel.type)
+
+    def channel_deleted(self, channel):
+        stats = self._stats.get(channel.guild.id)
+        if stats is not None:
+            stats.add_channel(channel.type, -1)
+
+    # 文字頻道與公告頻道可以互相轉換
+    def channel_updated(self, before, after):
+        stats = self._stats.get(after.guild.id)
+        if stats is not None and before.type != after.type:
+            stats.add_channel(before.type, -1)
+            stats.add_channel(after.type)
+
+    def role_created(self, role):
+        stats = self._stats.get(role.guild.id)
+        if stats is not None:
+            stats.roles += 1
+
+    def role_deleted(self, role):
+        stats = self._stats.get(role.guild.id)
+        if stats is not None:
+            stats.roles -= 1
+
+guild_stats = GuildStatsStore()
+
+# /serverinfo 顯示的頻道分類 (名稱 -> 頻道類型)
+CHANNEL_GROUPS = {
+    "文字": (discord.ChannelType.text, discord.ChannelType.news, discord.ChannelType.forum),
+    "語音": (discord.ChannelType.voice, discord.ChannelType.stage_voice),
+    "分類": (discord.ChannelType.category,),
+}
@@ -0,0 +1,45 @@
+import os
+import aiohttp
+
+# --- 共用 HTTP 連線設定 ---
+# 連線池總上限與單一主機上限
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', 100))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', 10))
+# 閒置連線保留秒數 (Keep-Alive)
+HTTP_KEEPALIVE = float(os.getenv('HTTP_KEEPALIVE', 30))
+# 連線器內建的 DNS 快取秒數
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', 300))
+# 預設逾時 (秒)，個別請求可再以 timeout 參數覆寫
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 10))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+
+_session = None
+
+# 建立全域共用的 ClientSession (由 DNSBot.setup_hook 呼叫)
+async def start():
+    global _session
+    if _session is not None and not _session.closed:
+        return _session
+
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+    )
+    timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _session
+
+# 取得共用 Session，尚未啟動時拋出錯誤
+def get_session():
+    if _session is None or _session.closed:
+        raise RuntimeError("HTTP 連線池尚未啟動")
+    return _session
+
+# 關閉共用 Session (由 DNSBot.close 呼叫)
+async def close():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
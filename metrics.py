@@ -0,0 +1,287 @@
+import os
+import math
+import time
+import bisect
+import functools
+import contextlib
+import contextvars
+import asyncio
+import discord
+import error
+import utils
+import monitor
+
+# --- 監控端點設定 ---
+# 預設關閉；啟用後在 METRICS_HOST:METRICS_PORT/metrics 提供 OpenMetrics 格式資料
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '0') == '1'
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9100)) + int(os.getenv('CLUSTER_ID', 0)) # 叢集模式下每個行程依編號遞增
+
+# 指令延遲直方圖的區間 (秒)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# --- 指標資料 ---
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+# 對數分桶的串流分位數估計 (相對誤差約 1%)：記憶體用量與樣本數無關，且可直接合併
+class LatencySketch:
+    MIN_VALUE = 1e-6
+
+    def __init__(self, accuracy=0.01):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero = 0
+        self.count = 0
+
+    def add(self, seconds):
+        self.count += 1
+        if seconds <= self.MIN_VALUE:
+            self.zero += 1
+            return
+        key = math.ceil(math.log(seconds) / self._log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.zero += other.zero
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def quantile(self, q):
+        if not self.count: return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if rank < seen: return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+command_calls = {}
+command_errors = {}
+command_latency = {}
+# 指令名稱 -> {階段: LatencySketch}；階段包含 total、defer 以及各外部呼叫 (dns、ip-api、whois、discord)
+command_sketches = {}
+
+# 記錄一次指令執行 (由 instrument 裝飾器呼叫)
+def record_command(name, seconds, failed=False):
+    command_calls[name] = command_calls.get(name, 0) + 1
+    if failed:
+        command_errors[name] = command_errors.get(name, 0) + 1
+    command_latency.setdefault(name, Histogram()).observe(seconds)
+
+def record_phase(name, phase, seconds):
+    command_sketches.setdefault(name, {}).setdefault(phase, LatencySketch()).add(seconds)
+
+# --- 指令計時 ---
+# 單次指令執行期間的計時資料，經由 contextvar 讓外部呼叫能記到目前的指令上
+class CommandTimer:
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.defer = None
+        self.external = {}
+
+    def add_external(self, kind, seconds):
+        self.external[kind] = self.external.get(kind, 0.0) + seconds
+
+_current_timer = contextvars.ContextVar('command_timer', default=None)
+
+# 目前正在執行的指令名稱 (不在指令中時為 None)
+def current_command():
+    timer = _current_timer.get()
+    return timer.name if timer else None
+
+# 將一段外部呼叫的耗時記到目前的指令上：with metrics.external("dns"): ...
+@contextlib.contextmanager
+def external(kind):
+    timer = _current_timer.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.add_external(kind, time.perf_counter() - start)
+
+# 指令/按鈕回呼的計時裝飾器，需放在 @tree.command / @discord.ui.button 之下
+def instrument(name):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            interaction = next((a for a in args if isinstance(a, discord.Interaction)), None)
+            # 變數名稱 command_timer 也供 monitor 的阻塞偵測從堆疊中辨識指令
+            command_timer = CommandTimer(name)
+            token = _current_timer.set(command_timer)
+            failed = False
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                _current_timer.reset(token)
+                record_phase(name, "total", time.perf_counter() - command_timer.start)
+                if command_timer.defer is not None:
+                    record_phase(name, "defer", command_timer.defer)
+                for kind, seconds in command_timer.external.items():
+                    record_phase(name, kind, seconds)
+                if interaction is not None:
+                    record_command(name, (discord.utils.utcnow() - interaction.created_at).total_seconds(), failed)
+        return wrapper
+    return decorator
+
+# Discord REST 呼叫計時：包裝 discord.py 的 HTTP 與互動 Webhook 請求，
+# 第一個互動回應 (defer / send_message) 完成的時間即為 time-to-defer
+def _timed_request(original):
+    @functools.wraps(original)
+    async def request(self, route, *args, **kwargs):
+        timer = _current_timer.get()
+        if timer is None:
+            return await original(self, route, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return await original(self, route, *args, **kwargs)
+        finally:
+            timer.add_external("discord", time.perf_counter() - start)
+            if timer.defer is None and route.url.endswith("/callback"):
+                timer.defer = time.perf_counter() - timer.start
+    return request
+
+_rest_timing_installed = False
+
+def install_rest_timing():
+    global _rest_timing_installed
+    if _rest_timing_installed: return
+    discord.http.HTTPClient.request = _timed_request(discord.http.HTTPClient.request)
+    discord.webhook.async_.AsyncWebhookAdapter.request = _timed_request(discord.webhook.async_.AsyncWebhookAdapter.request)
+    _rest_timing_installed = True
+
+# --- OpenMetrics 輸出 ---
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    if not labels: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+def _gauge(lines, name, help_text, samples):
+    lines.append(f"# TYPE {name} gauge")
+    lines.append(f"# HELP {name} {help_text}")
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(**labels)} {value}")
+
+def _counter(lines, name, help_text, samples):
+    lines.append(f"# TYPE {name} counter")
+    lines.append(f"# HELP {name} {help_text}")
+    for labels, value in samples:
+        lines.append(f"{name}_total{_labels(**labels)} {value}")
+
+def _histogram(lines, name, help_text, histograms):
+    lines.append(f"# TYPE {name} histogram")
+    lines.append(f"# HELP {name} {help_text}")
+    for labels, hist in histograms:
+        cumulative = 0
+        for bound, count in zip(hist.buckets, hist.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(**labels, le=float(bound))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {hist.count}")
+        lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+        lines.append(f"{name}_sum{_labels(**labels)} {hist.sum}")
+
+def render_metrics(bot):
+    lines = []
+    _counter(lines, "discord_bot_command_invocations", "Application command invocations.",
+             [({"command": name}, count) for name, count in sorted(command_calls.items())])
+    _counter(lines, "discord_bot_command_errors", "Application command invocations that raised an error.",
+             [({"command": name}, count) for name, count in sorted(command_errors.items())])
+    _histogram(lines, "discord_bot_command_latency_seconds", "Time from interaction creation to handler completion.",
+               [({"command": name}, hist) for name, hist in sorted(command_latency.items())])
+
+    latency = 0.0 if math.isnan(bot.latency) else bot.latency # 尚未連線時為 NaN
+    _gauge(lines, "discord_bot_gateway_latency_seconds", "Gateway heartbeat latency.", [({}, latency)])
+    _gauge(lines, "discord_bot_event_loop_lag_seconds", "Most recent event loop scheduling lag.", [({}, monitor.loop_lag_monitor.lag)])
+    _gauge(lines, "discord_bot_event_loop_lag_max_seconds", "Largest event loop lag since start.", [({}, monitor.loop_lag_monitor.max_lag)])
+    _counter(lines, "discord_bot_event_loop_blocked", "Event loop stalls longer than the watchdog threshold.", [({}, monitor.loop_lag_monitor.blocked_count)])
+
+    _gauge(lines, "discord_bot_guilds", "Guilds in cache.", [({}, len(bot.guilds))])
+    _gauge(lines, "discord_bot_users", "Users in cache.", [({}, len(bot.users))])
+    _gauge(lines, "discord_bot_cached_members", "Members in cache across all guilds.", [({}, sum(len(g.members) for g in bot.guilds))])
+
+    caches = (("dns", utils.dns_cache), ("ip", utils.ip_cache), ("member", utils.member_cache))
+    _gauge(lines, "discord_bot_cache_entries", "Entries currently held in a cache.", [({"cache": n}, c.stats()["size"]) for n, c in caches])
+    _counter(lines, "discord_bot_cache_hits", "Cache hits.", [({"cache": n}, c.hits) for n, c in caches])
+    _counter(lines, "discord_bot_cache_misses", "Cache misses.", [({"cache": n}, c.misses) for n, c in caches])
+    _counter(lines, "discord_bot_cache_evictions", "Cache LRU evictions.", [({"cache": n}, c.evictions) for n, c in caches])
+
+    shipper = error.webhook_shipper
+    _gauge(lines, "discord_bot_webhook_queue_depth", "Log records waiting to be shipped to the webhook.", [({}, shipper.queue.qsize())])
+    _counter(lines, "discord_bot_webhook_records", "Webhook log records by outcome.",
+             [({"outcome": k}, v) for k, v in shipper.stats.items()])
+
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+# --- 內嵌 HTTP 伺服器 (與機器人共用同一個事件迴圈) ---
+# fastapi / uvicorn 載入較慢，只在啟用監控端點時才 import
+def _embedded_server(config):
+    import uvicorn
+
+    class EmbeddedServer(uvicorn.Server):
+        # 訊號交給 discord.py 處理，避免 uvicorn 攔截 Ctrl+C
+        def install_signal_handlers(self):
+            pass
+
+        @contextlib.contextmanager
+        def capture_signals(self):
+            yield
+
+    return EmbeddedServer(config)
+
+_server = None
+_server_task = None
+
+async def start_server(bot):
+    global _server, _server_task
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import PlainTextResponse
+
+    app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+
+    @app.get("/metrics")
+    async def metrics_endpoint():
+        return PlainTextResponse(render_metrics(bot), media_type=OPENMETRICS_CONTENT_TYPE)
+
+    config = uvicorn.Config(app, host=METRICS_HOST, port=METRICS_PORT, log_level="warning", lifespan="off")
+    _server = _embedded_server(config)
+    _server_task = asyncio.create_task(_serve(_server))
+    error.logger.info(f"監控端點已啟動: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+# uvicorn 無法綁定連接埠時會呼叫 sys.exit()；監控端點是選用功能，失敗時只記錄錯誤，不影響機器人
+async def _serve(server):
+    try:
+        await server.serve()
+    except (SystemExit, Exception) as e:
+        error.logger.error(f"監控端點已停止 (http://{METRICS_HOST}:{METRICS_PORT}): {e!r}")
+
+async def stop_server():
+    global _server, _server_task
+    if _server is None: return
+    # 啟動失敗時任務早已結束 (錯誤已在 _serve 中記錄)
+    if not _server_task.done():
+        _server.should_exit = True
+        await _server_task
+    _server = _server_task = None
@@ -0,0 +1,168 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+import utils
+import error
+from collections import deque
+
+# --- 系統狀態取樣設定 ---
+# 取樣間隔 (秒) 與保留筆數 (預設 10 秒 x 360 筆 = 最近 1 小時)
+SYSTEM_SAMPLE_INTERVAL = float(os.getenv('SYSTEM_SAMPLE_INTERVAL', 10))
+SYSTEM_SAMPLE_HISTORY = int(os.getenv('SYSTEM_SAMPLE_HISTORY', 360))
+
+# 事件迴圈延遲的量測間隔 (秒)
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', 0.5))
+# 事件迴圈阻塞超過此秒數時擷取堆疊並記錄
+LOOP_BLOCK_THRESHOLD = float(os.getenv('LOOP_BLOCK_THRESHOLD', 0.5))
+# 是否同時將阻塞報告送到 Webhook
+LOOP_BLOCK_WEBHOOK = os.getenv('LOOP_BLOCK_WEBHOOK', '0') == '1'
+# 報告中保留的堆疊層數 (由內往外)
+LOOP_BLOCK_STACK_DEPTH = 15
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+# --- 背景取樣執行緒 ---
+# psutil / GPUtil (nvidia-smi) / 磁碟掃描都在這條執行緒中進行，
+# 指令只讀取最新一筆快照，不會阻塞事件迴圈
+class SystemSampler(threading.Thread):
+    def __init__(self, interval=SYSTEM_SAMPLE_INTERVAL, history=SYSTEM_SAMPLE_HISTORY):
+        super().__init__(name="system-sampler", daemon=True)
+        self.interval = interval
+        self.samples = deque(maxlen=history)
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        import psutil
+        return {
+            "time": time.time(),
+            "cpu": psutil.cpu_percent(interval=None),
+            "ram": psutil.virtual_memory().percent,
+            "disks": utils.get_disk_info(),
+            "gpu": utils.get_gpu_info(),
+        }
+
+    def run(self):
+        # psutil 在取樣執行緒中才載入，不佔用啟動時間
+        import psutil
+        # cpu_percent 第一次呼叫沒有比較基準 (固定回傳 0)，先呼叫一次再等待 1 秒
+        psutil.cpu_percent(interval=None)
+        if self._stop_event.wait(1): return
+        while True:
+            try:
+                self.samples.append(self.sample())
+            except Exception:
+                pass
+            if self._stop_event.wait(self.interval): return
+
+    def stop(self):
+        self._stop_event.set()
+
+    def latest(self):
+        return self.samples[-1] if self.samples else None
+
+    # 最近 minutes 分鐘內的取樣
+    def history(self, minutes):
+        cutoff = time.time() - minutes * 60
+        return [s for s in list(self.samples) if s["time"] >= cutoff]
+
+system_sampler = SystemSampler()
+
+# --- 事件迴圈延遲量測與阻塞偵測 ---
+# 迴圈內的任務定期 sleep 固定秒數，實際醒來時間與預期的差距即為迴圈被佔用的時間；
+# 另有一條看門狗執行緒檢查心跳，迴圈卡住超過門檻時直接擷取迴圈執行緒當下的堆疊
+class LoopLagMonitor:
+    def __init__(self, interval=LOOP_LAG_INTERVAL, threshold=LOOP_BLOCK_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.blocked_count = 0
+        self._task = None
+        self._loop = None
+        self._loop_thread_id = None
+        self._heartbeat = time.monotonic()
+        self._reported_heartbeat = None
+        self._stop_event = threading.Event()
+        self._watchdog = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread_id = threading.get_ident()
+            self._heartbeat = time.monotonic()
+            self._task = asyncio.create_task(self._run())
+        if self._watchdog is None:
+            self._stop_event.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self):
+        self._stop_event.set()
+        self._watchdog = None
+        if self._task is not None:
+            self._task.cancel()
+            try: await self._task
+            except asyncio.CancelledError: pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - start - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            self._heartbeat = time.monotonic()
+
+    # --- 看門狗執行緒 ---
+    def _watch(self):
+        while not self._stop_event.wait(self.threshold / 4):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            # 同一次阻塞只回報一次
+            if blocked_for < self.threshold or heartbeat == self._reported_heartbeat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._reported_heartbeat = heartbeat
+            self.blocked_count += 1
+            self._report(blocked_for, frame)
+
+    def _report(self, blocked_for, frame):
+        command = _command_from_stack(frame)
+        stack = "".join(traceback.format_stack(frame)[-LOOP_BLOCK_STACK_DEPTH:])
+        report = f"事件迴圈已阻塞超過 {blocked_for:.2f} 秒 (指令: /{command or '無'})\n{stack}"
+        error.logger.warning(report)
+        if LOOP_BLOCK_WEBHOOK and self._loop is not None:
+            # asyncio.Queue 不是執行緒安全的，交回事件迴圈執行 (迴圈恢復後才會送出)
+            self._loop.call_soon_threadsafe(error.send_webhook_log, report[-1800:], "WARNING")
+
+# 沿著堆疊往外找 metrics.instrument 包裝函式中的 command_timer，取得正在執行的指令名稱
+def _command_from_stack(frame):
+    while frame is not None:
+        timer = frame.f_locals.get("command_timer")
+        if timer is not None and hasattr(timer, "name"):
+            return timer.name
+        frame = frame.f_back
+    return None
+
+loop_lag_monitor = LoopLagMonitor()
+
+# 將百分比數值 (0~100) 轉成迷你走勢圖
+def sparkline(values, width=20):
+    if not values: return ""
+    # 取樣點太多時平均分組，讓寬度固定
+    if len(values) > width:
+        step = len(values) / width
+        buckets = [values[int(i * step):int((i + 1) * step)] for i in range(width)]
+        values = [sum(b) / len(b) for b in buckets]
+    return "".join(SPARK_CHARS[min(len(SPARK_CHARS) - 1, int(v / 100 * len(SPARK_CHARS)))] for v in values)
+
+# 最小 / 平均 / 最大值
+def summarize(values):
+    if not values: return None
+    return {"min": min(values), "avg": sum(values) / len(values), "max": max(values)}
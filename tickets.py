@@ -1,9 +1,227 @@
 import discord
 from discord.ui import View, Button
 import error
+import metrics
+import transcripts
+import utils
 import asyncio
+import json
 import os
-from datetime import datetime
+from collections import deque
+
+# --- 客服單索引設定 ---
+# (選填) 索引持久化位置，例如 log/ticket_registry.json；未設定時只在啟動時由頻道重建
+TICKET_REGISTRY_PATH = os.getenv('TICKET_REGISTRY_PATH', '')
+# 叢集模式下每個行程只保存自己負責的伺服器
+if TICKET_REGISTRY_PATH and os.getenv('CLUSTER_ID'):
+    TICKET_REGISTRY_PATH = "{0}-cluster{2}{1}".format(*os.path.splitext(TICKET_REGISTRY_PATH), os.getenv('CLUSTER_ID'))
+TICKET_PREFIX = "ticket-"
+
+# --- 開單排程設定 ---
+# 每個伺服器排隊中的開單請求上限
+TICKET_QUEUE_SIZE = int(os.getenv('TICKET_QUEUE_SIZE', 200))
+# 每個伺服器建立頻道的速率 (每 TICKET_CREATE_PER 秒最多 TICKET_CREATE_RATE 個)
+TICKET_CREATE_RATE = int(os.getenv('TICKET_CREATE_RATE', 10))
+TICKET_CREATE_PER = float(os.getenv('TICKET_CREATE_PER', 10))
+# (選填) 客服單頻道所屬的分類 ID
+TICKET_CATEGORY_ID = int(os.getenv('TICKET_CATEGORY_ID', 0)) or None
+
+# --- 客服單索引：(伺服器 ID, 開單者 ID) -> 頻道 ID ---
+# 開單者 ID 存在客服單頻道的 topic 中，啟動時掃描一次重建，之後由頻道建立/刪除事件維護
+class TicketRegistry:
+    def __init__(self, path=TICKET_REGISTRY_PATH):
+        self.path = path
+        self._tickets = {}   # 伺服器 ID -> {開單者 ID: 頻道 ID}
+        self._channels = {}  # 頻道 ID -> (伺服器 ID, 開單者 ID)，頻道刪除/更新時直接查表
+        self._save_task = None
+
+    @staticmethod
+    def owner_of(channel):
+        topic = getattr(channel, "topic", None)
+        if channel.name.startswith(TICKET_PREFIX) and topic and topic.isdigit():
+            return int(topic)
+        return None
+
+    def get(self, guild_id, owner_id):
+        return self._tickets.get(guild_id, {}).get(owner_id)
+
+    def _set(self, guild_id, owner_id, channel_id):
+        self._unset(channel_id)
+        tickets = self._tickets.setdefault(guild_id, {})
+        self._channels.pop(tickets.get(owner_id), None)
+        tickets[owner_id] = channel_id
+        self._channels[channel_id] = (guild_id, owner_id)
+
+    def _unset(self, channel_id):
+        key = self._channels.pop(channel_id, None)
+        if key is None: return False
+        guild_id, owner_id = key
+        tickets = self._tickets[guild_id]
+        del tickets[owner_id]
+        if not tickets:
+            del self._tickets[guild_id]
+        return True
+
+    def add(self, channel):
+        owner_id = self.owner_of(channel)
+        if owner_id is None: return
+        self._set(channel.guild.id, owner_id, channel.id)
+        self._schedule_save()
+
+    def remove(self, channel):
+        if self._unset(channel.id):
+            self._schedule_save()
+
+    def remove_guild(self, guild_id):
+        tickets = self._tickets.pop(guild_id, None)
+        if not tickets: return
+        for channel_id in tickets.values():
+            self._channels.pop(channel_id, None)
+        self._schedule_save()
+
+    def rebuild(self, guilds):
+        self._tickets = {}
+        self._channels = {}
+        for guild in guilds:
+            for channel in guild.text_channels:
+                owner_id = self.owner_of(channel)
+                if owner_id is not None:
+                    self._set(guild.id, owner_id, channel.id)
+        self._schedule_save()
+        return len(self._channels)
+
+    # --- 持久化 (選填) ---
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self, entries):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    async def load(self):
+        if not self.path or not os.path.exists(self.path): return
+        entries = await asyncio.to_thread(self._load)
+        self._tickets = {}
+        self._channels = {}
+        for guild_id, owner_id, channel_id in entries:
+            self._set(guild_id, owner_id, channel_id)
+
+    # 短時間內的多次變更合併成一次寫入
+    def _schedule_save(self):
+        if not self.path or (self._save_task and not self._save_task.done()): return
+        try:
+            self._save_task = asyncio.get_running_loop().create_task(self._delayed_save())
+        except RuntimeError:
+            pass
+
+    async def _delayed_save(self):
+        await asyncio.sleep(1)
+        entries = [[g, o, c] for c, (g, o) in self._channels.items()]
+        await asyncio.to_thread(self._save, entries)
+
+ticket_registry = TicketRegistry()
+
+class TicketQueueFull(RuntimeError):
+    pass
+
+# --- 開單排程：每個伺服器一個佇列，依固定的本地速率依序建立頻道 ---
+# 同一使用者同時只會有一個建立中的請求，連點不會建立兩個頻道
+class TicketScheduler:
+    def __init__(self, queue_size=TICKET_QUEUE_SIZE, rate=TICKET_CREATE_RATE, per=TICKET_CREATE_PER):
+        self.queue_size = queue_size
+        self.rate = rate
+        self.per = per
+        self._queues = {}   # 伺服器 ID -> deque[(使用者, Future)]
+        self._workers = {}  # 伺服器 ID -> 建立頻道的任務
+        self._buckets = {}  # 伺服器 ID -> TokenBucket
+        self._pending = {}  # (伺服器 ID, 使用者 ID) -> Future
+
+    def is_pending(self, guild_id, user_id):
+        return (guild_id, user_id) in self._pending
+
+    # 目前排在第幾位 (1 表示下一個處理)；不在佇列中時回傳 0
+    def position(self, guild_id, user_id):
+        for i, (user, _) in enumerate(self._queues.get(guild_id, ())):
+            if user.id == user_id:
+                return i + 1
+        return 0
+
+    # 加入佇列，回傳完成時結果為頻道的 Future；佇列已滿時拋出 TicketQueueFull
+    def submit(self, guild, user):
+        key = (guild.id, user.id)
+        if key in self._pending:
+            return self._pending[key]
+        queue = self._queues.setdefault(guild.id, deque())
+        if len(queue) >= self.queue_size:
+            raise TicketQueueFull("目前開單人數過多，請稍後再試")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        queue.append((user, future))
+        worker = self._workers.get(guild.id)
+        if worker is None or worker.done():
+            self._workers[guild.id] = asyncio.create_task(self._run(guild))
+        return future
+
+    async def _run(self, guild):
+        queue = self._queues[guild.id]
+        bucket = self._buckets.setdefault(guild.id, utils.TokenBucket(self.rate, self.per))
+        while queue:
+            user, future = queue[0]
+            await bucket.acquire()
+            # Discord 回傳 429 時 discord.py 會自行等待後重送，等待期間這個伺服器的佇列也一併暫停
+            try:
+                channel = await create_ticket_channel(guild, user)
+            except Exception as e:
+                queue.popleft()
+                self._finish(guild.id, user.id, future, exception=e)
+                continue
+            queue.popleft()
+            self._finish(guild.id, user.id, future, result=channel)
+        del self._queues[guild.id]
+
+    def _finish(self, guild_id, user_id, future, result=None, exception=None):
+        self._pending.pop((guild_id, user_id), None)
+        if future.done(): return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+ticket_scheduler = TicketScheduler()
+
+# 建立客服單頻道並送出歡迎訊息；使用者已有客服單時直接回傳既有頻道
+async def create_ticket_channel(guild, user):
+    existing_id = ticket_registry.get(guild.id, user.id)
+    existing_channel = guild.get_channel(existing_id) if existing_id else None
+    if existing_channel:
+        return existing_channel
+
+    overwrites = {
+        guild.default_role: discord.PermissionOverwrite(read_messages=False),
+        user: discord.PermissionOverwrite(read_messages=True, send_messages=True),
+        guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_channels=True)
+    }
+    category = guild.get_channel(TICKET_CATEGORY_ID) if TICKET_CATEGORY_ID else None
+    if not isinstance(category, discord.CategoryChannel):
+        category = None
+
+    channel = await guild.create_text_channel(
+        name=f"{TICKET_PREFIX}{user.name.lower().replace(' ', '-')}",
+        overwrites=overwrites,
+        category=category,
+        reason=f"Ticket created by {user}",
+        topic=str(user.id)
+    )
+    ticket_registry.add(channel)
+
+    embed = discord.Embed(title="📨 客服單已建立", description=f"您好 {user.mention}。", color=discord.Color.green())
+    await channel.send(user.mention, embed=embed, view=TicketControls())
+    return channel
 
 # --- 按鈕介面：開啟客服單 ---
 class TicketLauncher(View):
@@ -16,44 +234,54 @@ class TicketLauncher(View):
         await super().on_error(interaction, error, item)
 
     @discord.ui.button(label="📩 開啟客服單", style=discord.ButtonStyle.blurple, custom_id="ticket_create_btn")
+    @metrics.instrument("ticket_create")
     async def create_ticket(self, interaction: discord.Interaction, button: Button):
         await interaction.response.defer(ephemeral=True)
         
         guild = interaction.guild
         user = interaction.user
         
-        ticket_name = f"ticket-{user.name.lower().replace(' ', '-')}"
-        existing_channel = discord.utils.get(guild.text_channels, name=ticket_name)
+        existing_id = ticket_registry.get(guild.id, user.id)
+        existing_channel = guild.get_channel(existing_id) if existing_id else None
         
         if existing_channel:
             await interaction.followup.send(f"❌ 您已經有一個客服單了：{existing_channel.mention}", ephemeral=True)
             return
 
-        overwrites = {
-            guild.default_role: discord.PermissionOverwrite(read_messages=False),
-            user: discord.PermissionOverwrite(read_messages=True, send_messages=True),
-            guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_channels=True)
-        }
+        if ticket_scheduler.is_pending(guild.id, user.id):
+            await interaction.followup.send("⏳ 您的客服單正在建立中，請稍候。", ephemeral=True)
+            return
 
         try:
-            channel = await guild.create_text_channel(
-                name=ticket_name, 
-                overwrites=overwrites, 
-                reason=f"Ticket created by {user}",
-                topic=str(user.id)
-            )
-            
-            embed = discord.Embed(title="📨 客服單已建立", description=f"您好 {user.mention}。", color=discord.Color.green())
-            await channel.send(user.mention, embed=embed, view=TicketControls())
-            
-            await interaction.followup.send(f"✅ 客服單已建立：{channel.mention}", ephemeral=True)
-            error.log_command(interaction, "ticket_create", f"建立頻道 {channel.name}", interaction.client)
+            future = ticket_scheduler.submit(guild, user)
+        except TicketQueueFull as e:
+            await interaction.followup.send(f"❌ {e}", ephemeral=True)
+            return
+
+        # 前面還有人排隊時先告知位置，完成後再更新同一則訊息
+        status_msg = None
+        position = ticket_scheduler.position(guild.id, user.id)
+        if position > 1:
+            status_msg = await interaction.followup.send(f"⏳ 目前開單人數較多，您排在第 {position} 位，完成後會通知您。", ephemeral=True)
 
+        try:
+            channel = await future
         except Exception as e:
             error.logger.error(f"建立 Ticket 失敗: {e}")
             try:
                 await interaction.followup.send("❌ 建立失敗，請檢查機器人權限。", ephemeral=True)
             except: pass
+            return
+
+        content = f"✅ 客服單已建立：{channel.mention}"
+        try:
+            if status_msg:
+                await status_msg.edit(content=content)
+            else:
+                await interaction.followup.send(content, ephemeral=True)
+        except discord.HTTPException:
+            pass
+        error.log_command(interaction, "ticket_create", f"建立頻道 {channel.name}", interaction.client)
 
 # --- 按鈕介面：管理客服單 ---
 class TicketControls(View):
@@ -66,47 +294,30 @@ class TicketControls(View):
         await super().on_error(interaction, error, item)
 
     @discord.ui.button(label="🔒 關閉並儲存紀錄", style=discord.ButtonStyle.red, custom_id="ticket_close_btn")
+    @metrics.instrument("ticket_close")
     async def close_ticket(self, interaction: discord.Interaction, button: Button):
         await interaction.response.defer()
-        await interaction.followup.send("💾 正在儲存對話紀錄，頻道將在 5 秒後刪除...")
+        status_msg = await interaction.followup.send("💾 正在儲存對話紀錄，頻道將在 5 秒後刪除...")
         
         channel = interaction.channel
         closer_user = interaction.user 
-        
-        save_dir = "log/transcripts"
-        if not os.path.exists(save_dir):
-            os.makedirs(save_dir)
 
-        transcript = [f"--- Ticket Transcript: {channel.name} ---", f"Time: {datetime.now()}", "-"*30]
-        
-        async for message in channel.history(limit=None, oldest_first=True):
-            timestamp = message.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            author = f"{message.author.name}"
-            content = message.content
-            line = f"[{timestamp}] {author}: {content}"
-            transcript.append(line)
-            if message.attachments:
-                for attachment in message.attachments:
-                    transcript.append(f"    [附件]: {attachment.url}")
-        
-        transcript.append("-" * 30)
-        transcript_text = "\n".join(transcript)
+        # 訊息很多的客服單會定期更新進度
+        async def on_progress(count):
+            try: await status_msg.edit(content=f"💾 正在儲存對話紀錄 (已處理 {count} 則訊息)，完成後頻道將在 5 秒後刪除...")
+            except Exception: pass
 
-        file_name = f"{channel.name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
-        file_path = os.path.join(save_dir, file_name)
-        
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(transcript_text)
+        file_path, message_count = await transcripts.export_channel(channel, on_progress)
             
-        error.logger.info(f"客服單紀錄已儲存: {file_path}")
+        error.logger.info(f"客服單紀錄已儲存: {file_path} ({message_count} 則訊息)")
 
         # [重點修正] 抓取接收者
         recipient = None
         if channel.topic and channel.topic.isdigit():
             ticket_owner_id = int(channel.topic)
             try:
-                # 改用 fetch_member (API 請求)，解決 get_member (Cache) 找不到人的問題
-                recipient = await interaction.guild.fetch_member(ticket_owner_id)
+                # 快取中沒有時才呼叫 API (低記憶體模式下不會快取成員)
+                recipient = await utils.get_member(interaction.guild, ticket_owner_id)
             except discord.NotFound:
                 # 如果使用者已經退出伺服器
                 error.logger.warning(f"使用者 {ticket_owner_id} 已離開，無法發送紀錄。")
@@ -0,0 +1,398 @@
+import os
+import re
+import gzip
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import asyncio
+import aiohttp
+import error
+import http_client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# --- 對話紀錄設定 ---
+TRANSCRIPT_DIR = os.path.join("log", "transcripts")
+# 是否以 gzip 壓縮對話紀錄 (.txt.gz)
+TRANSCRIPT_GZIP = os.getenv('TRANSCRIPT_GZIP', '0') == '1'
+# 每累積多少則訊息寫入一次檔案 (與 Discord API 單次取得的上限相同)
+TRANSCRIPT_PAGE_SIZE = 100
+# 每處理多少則訊息回報一次進度
+TRANSCRIPT_PROGRESS_EVERY = int(os.getenv('TRANSCRIPT_PROGRESS_EVERY', 1000))
+# 是否額外輸出 JSON Lines 格式 (每則訊息一行，附件指向本地檔案)
+TRANSCRIPT_JSONL = os.getenv('TRANSCRIPT_JSONL', '0') == '1'
+
+# --- 附件歸檔設定 ---
+# 附件以內容的 SHA-256 命名存放，相同檔案只保存一份
+ATTACHMENT_DIR = os.path.join(TRANSCRIPT_DIR, "attachments")
+ARCHIVE_ATTACHMENTS = os.getenv('ARCHIVE_ATTACHMENTS', '1') == '1'
+# 單一附件大小上限 (位元組) 與同時下載數量
+ATTACHMENT_MAX_BYTES = int(os.getenv('ATTACHMENT_MAX_BYTES', 25 * 1024 * 1024))
+ATTACHMENT_CONCURRENCY = int(os.getenv('ATTACHMENT_CONCURRENCY', 8))
+ATTACHMENT_CHUNK_SIZE = 256 * 1024
+# 下載附件不限總時間 (接近上限的大檔案在慢速連線下可能需要數分鐘)，只在連線停滯超過此秒數時放棄
+ATTACHMENT_READ_TIMEOUT = float(os.getenv('ATTACHMENT_READ_TIMEOUT', 30))
+
+# --- 全文檢索設定 ---
+# 對話紀錄寫入時同步建立 SQLite FTS5 索引，供 /transcript_search 使用
+TRANSCRIPT_INDEX = os.getenv('TRANSCRIPT_INDEX', '1') == '1'
+TRANSCRIPT_INDEX_PATH = os.path.join(TRANSCRIPT_DIR, "index.db")
+# trigram 分詞可直接搜尋中文 (關鍵字至少 3 個字元)；舊版 SQLite 不支援時改用 unicode61
+TRANSCRIPT_INDEX_TOKENIZERS = ("trigram", "unicode61")
+SEARCH_SNIPPET_TOKENS = 64
+
+# 文字紀錄中單則訊息的開頭：[2024-01-01 12:00:00] 使用者: 內容
+MESSAGE_LINE = re.compile(r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] (.*?): (.*)$")
+HEADER_LINE = re.compile(r"^--- Ticket Transcript: (.*) ---$")
+
+# --- 串流寫入器：逐頁寫入，檔案操作都在執行緒中進行 ---
+class TranscriptWriter:
+    def __init__(self, channel_name, compress=TRANSCRIPT_GZIP, extension="txt"):
+        file_name = f"{channel_name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}"
+        if compress:
+            file_name += ".gz"
+        self.path = os.path.join(TRANSCRIPT_DIR, file_name)
+        self.compress = compress
+        self._file = None
+
+    def _open(self):
+        os.makedirs(TRANSCRIPT_DIR, exist_ok=True)
+        if self.compress:
+            self._file = gzip.open(self.path, "wt", encoding="utf-8")
+        else:
+            self._file = open(self.path, "w", encoding="utf-8")
+
+    def _write(self, lines):
+        self._file.write("\n".join(lines) + "\n")
+
+    async def open(self):
+        await asyncio.to_thread(self._open)
+
+    async def write_lines(self, lines):
+        if lines:
+            await asyncio.to_thread(self._write, lines)
+
+    async def close(self):
+        if self._file:
+            await asyncio.to_thread(self._file.close)
+
+# --- 附件歸檔：平行下載，以內容雜湊命名去除重複 ---
+class AttachmentArchiver:
+    def __init__(self, concurrency=ATTACHMENT_CONCURRENCY):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.stats = {"downloaded": 0, "deduplicated": 0, "skipped": 0, "failed": 0, "bytes": 0}
+
+    # 下載單一附件，回傳相對於 TRANSCRIPT_DIR 的本地路徑；超過大小或失敗時回傳 None
+    async def archive(self, attachment):
+        if attachment.size > ATTACHMENT_MAX_BYTES:
+            self.stats["skipped"] += 1
+            return None
+        async with self._semaphore:
+            try:
+                return await self._download(attachment)
+            except Exception:
+                self.stats["failed"] += 1
+                return None
+
+    async def _download(self, attachment):
+        await asyncio.to_thread(os.makedirs, ATTACHMENT_DIR, exist_ok=True)
+        tmp_path = os.path.join(ATTACHMENT_DIR, f".tmp-{uuid.uuid4().hex}")
+        digest = hashlib.sha256()
+        size = 0
+
+        session = http_client.get_session()
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            # 共用連線池的預設逾時 (HTTP_TIMEOUT) 包含讀取內容的時間，不適用於大型附件
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=http_client.HTTP_CONNECT_TIMEOUT, sock_read=ATTACHMENT_READ_TIMEOUT)
+            async with session.get(attachment.url, timeout=timeout) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.content.iter_chunked(ATTACHMENT_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > ATTACHMENT_MAX_BYTES:
+                        raise ValueError("附件超過大小上限")
+                    digest.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+        except BaseException:
+            await asyncio.to_thread(f.close)
+            await asyncio.to_thread(os.remove, tmp_path)
+            raise
+        await asyncio.to_thread(f.close)
+
+        hex_digest = digest.hexdigest()
+        extension = os.path.splitext(attachment.filename)[1].lower()[:10]
+        relative_path = os.path.join("attachments", hex_digest[:2], hex_digest + extension)
+        stored = await asyncio.to_thread(_store_file, tmp_path, os.path.join(TRANSCRIPT_DIR, relative_path))
+        self.stats["downloaded" if stored else "deduplicated"] += 1
+        self.stats["bytes"] += size if stored else 0
+        return relative_path
+
+# 將暫存檔移到雜湊路徑；已存在相同內容時刪除暫存檔並回傳 False
+def _store_file(tmp_path, dest_path):
+    if os.path.exists(dest_path):
+        os.remove(tmp_path)
+        return False
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    os.replace(tmp_path, dest_path)
+    return True
+
+# --- 全文檢索索引 ---
+# 所有 SQLite 操作都在專屬的單一執行緒中進行 (連線只在該執行緒中使用)
+class TranscriptIndex:
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='transcript-index')
+        self._backfill_task = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path)
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS transcripts (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, channel TEXT NOT NULL, created_at TEXT)")
+            for tokenizer in TRANSCRIPT_INDEX_TOKENIZERS:
+                try:
+                    conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(content, author, time UNINDEXED, transcript_id UNINDEXED, tokenize='{tokenizer}')")
+                    break
+                except sqlite3.OperationalError:
+                    continue
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _begin(self, path, channel, created_at):
+        conn = self._connect()
+        cursor = conn.execute("INSERT OR REPLACE INTO transcripts (path, channel, created_at) VALUES (?, ?, ?)", (path, channel, created_at))
+        conn.commit()
+        return cursor.lastrowid
+
+    def _add(self, transcript_id, rows):
+        conn = self._connect()
+        conn.executemany("INSERT INTO messages (content, author, time, transcript_id) VALUES (?, ?, ?, ?)",
+                         [(content, author, ts, transcript_id) for ts, author, content in rows])
+        conn.commit()
+
+    def _search(self, query, limit):
+        sql = (
+            "SELECT t.channel, t.path, m.time, m.author, "
+            f"snippet(messages, 0, '**', '**', '…', {SEARCH_SNIPPET_TOKENS}) "
+            "FROM messages m JOIN transcripts t ON t.id = m.transcript_id "
+            "WHERE messages MATCH ? ORDER BY bm25(messages) LIMIT ?"
+        )
+        rows = self._connect().execute(sql, (query, limit)).fetchall()
+        return [{"channel": c, "path": p, "time": ts, "author": a, "snippet": s} for c, p, ts, a, s in rows]
+
+    def _stats(self):
+        conn = self._connect()
+        transcripts = conn.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+        messages = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return {"transcripts": transcripts, "messages": messages}
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # 開始索引一份新的對話紀錄，回傳 transcript_id
+    async def begin(self, path, channel):
+        return await self._call(self._begin, _relative_path(path), channel, datetime.now().isoformat(timespec='seconds'))
+
+    # rows: [(時間, 作者, 內容)]
+    async def add(self, transcript_id, rows):
+        if rows:
+            await self._call(self._add, transcript_id, rows)
+
+    async def search(self, text, limit=10):
+        query = build_match_query(text)
+        if not query: return []
+        return await self._call(self._search, query, limit)
+
+    async def stats(self):
+        return await self._call(self._stats)
+
+    # --- 舊紀錄一次性回填 ---
+    # 逐檔送進執行緒處理，回填期間搜尋與新的對話紀錄仍可穿插進行
+    def _pending_files(self):
+        conn = self._connect()
+        if conn.execute("SELECT value FROM meta WHERE key = 'backfill_done'").fetchone():
+            return []
+        indexed = {row[0] for row in conn.execute("SELECT path FROM transcripts")}
+        files = []
+        for entry in os.scandir(TRANSCRIPT_DIR) if os.path.isdir(TRANSCRIPT_DIR) else ():
+            if entry.is_file() and entry.name.endswith((".txt", ".txt.gz")) and entry.name not in indexed:
+                files.append(entry.path)
+        return sorted(files)
+
+    def _backfill_file(self, path):
+        channel, rows = parse_transcript(path)
+        conn = self._connect()
+        # 單一檔案在同一個交易中寫入，中斷後重新回填不會留下半份紀錄
+        with conn:
+            cursor = conn.execute("INSERT OR IGNORE INTO transcripts (path, channel, created_at) VALUES (?, ?, ?)",
+                                  (_relative_path(path), channel, datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec='seconds')))
+            if cursor.rowcount:
+                conn.executemany("INSERT INTO messages (content, author, time, transcript_id) VALUES (?, ?, ?, ?)",
+                                 [(content, author, ts, cursor.lastrowid) for ts, author, content in rows])
+        return len(rows)
+
+    def _finish_backfill(self):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('backfill_done', ?)", (str(time.time()),))
+        conn.commit()
+
+    async def backfill(self):
+        files = await self._call(self._pending_files)
+        if not files: return
+        start = time.perf_counter()
+        messages = 0
+        for path in files:
+            try:
+                messages += await self._call(self._backfill_file, path)
+            except Exception as e:
+                error.logger.warning(f"對話紀錄回填失敗 ({path}): {e}")
+        await self._call(self._finish_backfill)
+        error.logger.info(f"對話紀錄索引回填完成: {len(files)} 份 / {messages} 則訊息 ({time.perf_counter() - start:.1f} 秒)")
+
+    def start_backfill(self):
+        if self._backfill_task is None or self._backfill_task.done():
+            self._backfill_task = asyncio.create_task(self.backfill())
+
+    async def close(self):
+        if self._backfill_task is not None:
+            self._backfill_task.cancel()
+            try: await self._backfill_task
+            except asyncio.CancelledError: pass
+            self._backfill_task = None
+        await self._call(self._close)
+        self._executor.shutdown(wait=False)
+
+transcript_index = TranscriptIndex(TRANSCRIPT_INDEX_PATH)
+
+def _relative_path(path):
+    return os.path.relpath(path, TRANSCRIPT_DIR)
+
+# 將使用者輸入轉成 FTS5 查詢：每個詞加上引號視為字面字串 (避免 AND/OR/NEAR、* 等語法)，詞之間為 AND
+def build_match_query(text):
+    tokens = text.split()
+    return " ".join('"' + token.replace('"', '""') + '"' for token in tokens)
+
+# 解析既有的文字紀錄，回傳 (頻道名稱, [(時間, 作者, 內容)])
+def parse_transcript(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    channel = os.path.basename(path).split(".")[0].rsplit("-", 2)[0]
+    rows = []
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            header = HEADER_LINE.match(line)
+            if header:
+                channel = header.group(1)
+                continue
+            match = MESSAGE_LINE.match(line)
+            if match:
+                rows.append(list(match.groups()))
+            elif rows and line.startswith("    [附件]: "):
+                rows[-1][2] += "\n" + line.strip()
+            elif rows and line != "-" * 30:
+                # 多行訊息的後續行
+                rows[-1][2] += "\n" + line
+    return channel, [tuple(row) for row in rows]
+
+# 單則訊息的索引內容 (附件以檔名加入，方便以檔名搜尋)
+def index_row(message):
+    content = message.content
+    if message.attachments:
+        content += "\n" + " ".join(a.filename for a in message.attachments)
+    return (message.created_at.strftime('%Y-%m-%d %H:%M:%S'), message.author.name, content)
+
+# 單則訊息的文字紀錄 (local_paths 與 message.attachments 順序相同)
+def format_message(message, local_paths=None):
+    timestamp = message.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    lines = [f"[{timestamp}] {message.author.name}: {message.content}"]
+    for i, attachment in enumerate(message.attachments):
+        local_path = local_paths[i] if local_paths else None
+        if local_path:
+            lines.append(f"    [附件]: {local_path} (原始連結: {attachment.url})")
+        else:
+            lines.append(f"    [附件]: {attachment.url}")
+    return lines
+
+def format_message_json(message, local_paths=None):
+    return json.dumps({
+        "id": message.id,
+        "time": message.created_at.isoformat(),
+        "author": message.author.name,
+        "author_id": message.author.id,
+        "content": message.content,
+        "attachments": [
+            {"filename": a.filename, "size": a.size, "url": a.url, "local": local_paths[i] if local_paths else None}
+            for i, a in enumerate(message.attachments)
+        ]
+    }, ensure_ascii=False)
+
+# 逐頁讀取頻道歷史並寫入檔案，記憶體用量與訊息數量無關；每頁的附件會平行下載後再寫入
+# on_progress(count) 會在每處理 TRANSCRIPT_PROGRESS_EVERY 則訊息時被呼叫；回傳 (檔案路徑, 訊息數)
+async def export_channel(channel, on_progress=None):
+    writer = TranscriptWriter(channel.name)
+    json_writer = TranscriptWriter(channel.name, extension="jsonl") if TRANSCRIPT_JSONL else None
+    archiver = AttachmentArchiver() if ARCHIVE_ATTACHMENTS else None
+
+    async def flush(messages):
+        if archiver:
+            downloads = [asyncio.gather(*[archiver.archive(a) for a in m.attachments]) for m in messages]
+            local_paths = await asyncio.gather(*downloads)
+        else:
+            local_paths = [None] * len(messages)
+        lines = []
+        for message, paths in zip(messages, local_paths):
+            lines.extend(format_message(message, paths))
+        await writer.write_lines(lines)
+        if json_writer:
+            await json_writer.write_lines([format_message_json(m, p) for m, p in zip(messages, local_paths)])
+        await index(messages)
+
+    # 索引只是輔助功能，失敗時記錄後繼續匯出
+    transcript_id = None
+    async def index(messages):
+        nonlocal transcript_id
+        if not TRANSCRIPT_INDEX: return
+        try:
+            if transcript_id is None:
+                transcript_id = await transcript_index.begin(writer.path, channel.name)
+            await transcript_index.add(transcript_id, [index_row(m) for m in messages])
+        except Exception as e:
+            error.logger.warning(f"對話紀錄索引失敗 ({channel.name}): {e}")
+
+    await writer.open()
+    if json_writer:
+        await json_writer.open()
+    try:
+        await writer.write_lines([f"--- Ticket Transcript: {channel.name} ---", f"Time: {datetime.now()}", "-"*30])
+
+        page, count = [], 0
+        async for message in channel.history(limit=None, oldest_first=True):
+            page.append(message)
+            count += 1
+            if len(page) >= TRANSCRIPT_PAGE_SIZE:
+                await flush(page)
+                page = []
+            if on_progress and count % TRANSCRIPT_PROGRESS_EVERY == 0:
+                await on_progress(count)
+
+        await flush(page)
+        await writer.write_lines(["-" * 30])
+    finally:
+        await writer.close()
+        if json_writer:
+            await json_writer.close()
+
+    if archiver:
+        stats = archiver.stats
+        error.logger.info(f"附件歸檔 ({channel.name}): 下載 {stats['downloaded']}、重複 {stats['deduplicated']}、略過 {stats['skipped']}、失敗 {stats['failed']}")
+    return writer.path, count
@@ -1,10 +1,141 @@
+import os
 import re
+import time
+import json
+import sqlite3
+import asyncio
 import aiohttp
 import ipaddress
-import dns.resolver
-import GPUtil
-import psutil
-from datetime import datetime
+import error
+import http_client
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# whois、dnspython、geoip2、GPUtil、psutil 載入較慢，改在第一次使用的函式中才 import，縮短啟動時間
+
+# --- DNS 查詢設定 ---
+# /dns 會同時查詢的紀錄類型 (依顯示順序)
+DNS_RECORD_TYPES = ("A", "AAAA", "CNAME", "MX", "TXT", "NS", "SOA")
+# 整體查詢期限 (秒)：所有紀錄共用同一個期限，而不是每種紀錄各自等待
+DNS_TIMEOUT = float(os.getenv('DNS_TIMEOUT', 5))
+# DNS 快取的最大項目數 (超過時淘汰最久未使用的項目)
+DNS_CACHE_SIZE = int(os.getenv('DNS_CACHE_SIZE', 1024))
+# 查無資料 (NXDOMAIN / NoAnswer) 且回應中沒有 SOA 時的預設快取秒數
+DNS_NEGATIVE_TTL = int(os.getenv('DNS_NEGATIVE_TTL', 60))
+
+# --- IP 查詢設定 ---
+# ip-api 查詢逾時 (秒)
+IP_API_TIMEOUT = float(os.getenv('IP_API_TIMEOUT', 10))
+# 使用原本的外部 API 網址，並指定需要的欄位
+IP_API_FIELDS = "status,message,country,city,isp,reverse,query"
+# ip-api 免費版公開的頻率限制：單筆端點每分鐘 45 次，批次端點每分鐘 15 次 (每次最多 100 個 IP)
+IP_API_RATE = int(os.getenv('IP_API_RATE', 45))
+IP_API_BATCH_RATE = int(os.getenv('IP_API_BATCH_RATE', 15))
+IP_API_BATCH_SIZE = 100
+# 批次端點的額度較少，只在一次合併至少這麼多個 IP 時使用 (預設為兩個端點額度的比例，即 45 / 15 = 3)；
+# 數量較少時改以單筆端點逐一查詢，單筆額度用完時才改用批次端點
+IP_API_BATCH_MIN = int(os.getenv('IP_API_BATCH_MIN', max(2, round(IP_API_RATE / IP_API_BATCH_RATE))))
+# 收集批次請求的等待視窗 (秒)
+IP_API_BATCH_WINDOW = float(os.getenv('IP_API_BATCH_WINDOW', 0.05))
+# 單筆查詢最多排隊秒數，以及遇到 429 時的重試次數
+IP_API_MAX_WAIT = float(os.getenv('IP_API_MAX_WAIT', 30))
+IP_API_MAX_RETRIES = 3
+# 本地 MaxMind 資料庫路徑 (GeoLite2-City / GeoIP2-City)，未設定時只使用 ip-api
+GEOIP_CITY_DB = os.getenv('GEOIP_CITY_DB', '')
+# ISP 資料庫路徑 (GeoIP2-ISP 或 GeoLite2-ASN)，選填
+GEOIP_ISP_DB = os.getenv('GEOIP_ISP_DB', '')
+# 國家/城市名稱語系
+GEOIP_LOCALE = os.getenv('GEOIP_LOCALE', 'en')
+# 本地資料庫缺少欄位時，是否改向 ip-api 補查
+IP_API_FALLBACK = os.getenv('IP_API_FALLBACK', '1') == '1'
+# /ip 顯示的欄位
+IP_INFO_FIELDS = ("country", "city", "isp", "reverse")
+# IP 查詢結果快取：最大項目數、成功結果秒數、失敗結果秒數
+IP_CACHE_SIZE = int(os.getenv('IP_CACHE_SIZE', 4096))
+IP_CACHE_TTL = int(os.getenv('IP_CACHE_TTL', 3600))
+IP_NEGATIVE_TTL = int(os.getenv('IP_NEGATIVE_TTL', 30))
+
+# --- WHOIS 查詢設定 ---
+# WHOIS 專用執行緒數量，以及允許排隊中的查詢上限
+WHOIS_WORKERS = int(os.getenv('WHOIS_WORKERS', 4))
+WHOIS_MAX_PENDING = int(os.getenv('WHOIS_MAX_PENDING', 16))
+# 持久化快取位置 (重啟後仍有效)
+WHOIS_CACHE_PATH = os.getenv('WHOIS_CACHE_PATH', os.path.join('log', 'whois_cache.db'))
+# 快取秒數的上下限，實際秒數依紀錄的穩定程度決定
+WHOIS_MIN_TTL = int(os.getenv('WHOIS_MIN_TTL', 3600))
+WHOIS_MAX_TTL = int(os.getenv('WHOIS_MAX_TTL', 7 * 86400))
+
+# --- 成員查詢設定 ---
+# 低記憶體模式下不快取成員，需要時向 API 查詢並暫存在小型 LRU 中
+MEMBER_CACHE_SIZE = int(os.getenv('MEMBER_CACHE_SIZE', 1000))
+MEMBER_CACHE_TTL = int(os.getenv('MEMBER_CACHE_TTL', 300))
+
+# 快取查無項目時的標記 (None 本身是合法的快取值)
+_MISS = object()
+
+# --- 具 TTL 與 LRU 淘汰的快取 ---
+class TTLCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl):
+        if ttl <= 0: return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data), "max_entries": self.max_entries,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "hit_rate": (self.hits / lookups * 100) if lookups else 0.0
+        }
+
+# 以 (網域, 紀錄類型) 為鍵的 DNS 回應快取
+dns_cache = TTLCache(DNS_CACHE_SIZE)
+
+# 以 (伺服器 ID, 使用者 ID) 為鍵的成員快取
+member_cache = TTLCache(MEMBER_CACHE_SIZE)
+
+# 取得成員：先查 discord.py 的快取，再查 LRU，最後才呼叫 API (查無成員時拋出 discord.NotFound)
+async def get_member(guild, user_id):
+    member = guild.get_member(user_id)
+    if member is not None:
+        return member
+    key = (guild.id, user_id)
+    member = member_cache.get(key)
+    if member is None:
+        member = await guild.fetch_member(user_id)
+        member_cache.set(key, member, MEMBER_CACHE_TTL)
+    return member
 
 # 清理網域字串
 def clean_domain(url):
@@ -16,6 +147,8 @@ def clean_domain(url):
 def format_whois_date(d):
     if isinstance(d, list):
         d = d[0] if len(d) > 0 else None
+    if isinstance(d, str):
+        return d[:10]
     return d.strftime('%Y-%m-%d') if d else "未知"
 
 # 檢查是否為受限 IP
@@ -39,6 +172,7 @@ def create_progress_bar(percent, length=10):
 # 硬體資訊函式 (GPU/Disk)
 def get_gpu_info():
     try:
+        import GPUtil
         gpus = GPUtil.getGPUs()
         if not gpus: return None
         gpu = gpus[0]
@@ -48,6 +182,7 @@ def get_gpu_info():
 def get_disk_info():
     disk_results = []
     try:
+        import psutil
         partitions = psutil.disk_partitions(all=False)
         for partition in partitions:
             if 'cdrom' in partition.opts or partition.fstype == '': continue
@@ -62,22 +197,492 @@ def get_disk_info():
         return disk_results
     except Exception: return None
 
+# --- IP 查詢後端 ---
+# ip-api 回傳 429 (超過頻率限制)，retry_after 為距離額度重置的秒數
+class IPAPIRateLimited(RuntimeError):
+    def __init__(self, retry_after):
+        super().__init__(f"IP-API HTTP 錯誤 429 (請求過多，{retry_after} 秒後重置)")
+        self.retry_after = retry_after
+
+# --- ip-api 請求排程 (令牌桶 + 批次端點) ---
+# 令牌桶：每 per 秒補充 rate 個令牌，並可依伺服器回報的剩餘額度暫停
+class TokenBucket:
+    def __init__(self, rate, per):
+        self.capacity = rate
+        self.tokens = float(rate)
+        self.fill_rate = rate / per
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            wait = self.blocked_until - time.monotonic()
+            if wait <= 0 and self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(max(wait, (1 - self.tokens) / self.fill_rate))
+
+    # 目前是否有 count 個令牌可立即使用 (不消耗)
+    def available(self, count=1):
+        self._refill()
+        return self.blocked_until <= time.monotonic() and self.tokens >= count
+
+    # 依 X-Rl (本視窗剩餘次數) / X-Ttl (距離重置秒數) 校正本地狀態
+    def update(self, remaining, reset_in):
+        self._refill()
+        self.tokens = min(self.tokens, remaining)
+        if remaining <= 0:
+            self.blocked_until = time.monotonic() + reset_in
+
+class IPAPIScheduler:
+    def __init__(self):
+        self.single_bucket = TokenBucket(IP_API_RATE, 60)
+        self.batch_bucket = TokenBucket(IP_API_BATCH_RATE, 60)
+        self._queue = asyncio.Queue()
+        self._worker = None
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try: await self._worker
+            except asyncio.CancelledError: pass
+            self._worker = None
+
+    # 排入查詢並等待結果；排隊超過 IP_API_MAX_WAIT 秒則放棄
+    async def lookup(self, ip_address):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((ip_address, future))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), IP_API_MAX_WAIT)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"IP-API 查詢排隊逾時 ({IP_API_MAX_WAIT} 秒)")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            ip_address, future = await self._queue.get()
+            pending = {ip_address: [future]}
+
+            # 在短暫的視窗內收集其他查詢，合併成一次批次請求
+            deadline = loop.time() + IP_API_BATCH_WINDOW
+            while len(pending) < IP_API_BATCH_SIZE:
+                try:
+                    ip_address, future = await asyncio.wait_for(self._queue.get(), max(0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                pending.setdefault(ip_address, []).append(future)
+
+            try:
+                results = await self._dispatch(list(pending))
+            except Exception as e:
+                results = dict.fromkeys(pending, e)
+
+            for ip_address, result in results.items():
+                for f in pending.get(ip_address, []):
+                    if f.done(): continue
+                    if isinstance(result, Exception):
+                        f.set_exception(result)
+                    else:
+                        f.set_result(result)
+
+    # 回傳 {IP: 結果或例外}
+    async def _dispatch(self, ips):
+        # 大批查詢，或單筆額度已用完而批次額度還有剩時，合併成一次批次請求
+        if len(ips) >= IP_API_BATCH_MIN or (not self.single_bucket.available(len(ips)) and self.batch_bucket.available()):
+            return await self._send(ips, batch=True)
+        # 其餘以單筆端點逐一查詢 (同時送出)，批次額度留給大批查詢
+        results = await asyncio.gather(*(self._send([ip], batch=False) for ip in ips), return_exceptions=True)
+        merged = {}
+        for ip_address, result in zip(ips, results):
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+            merged.update({ip_address: result} if isinstance(result, Exception) else result)
+        return merged
+
+    async def _send(self, ips, batch):
+        bucket = self.batch_bucket if batch else self.single_bucket
+        for _ in range(IP_API_MAX_RETRIES):
+            await bucket.acquire()
+            try:
+                if not batch:
+                    return {ips[0]: await self._request("GET", f"http://ip-api.com/json/{ips[0]}", bucket)}
+                data = await self._request("POST", "http://ip-api.com/batch", bucket, json=ips)
+                return dict(zip(ips, data))
+            except IPAPIRateLimited:
+                # 已在 bucket.update 中依 X-Ttl 暫停，下一輪會自動等待
+                continue
+        raise IPAPIRateLimited(int(bucket.blocked_until - time.monotonic()) + 1)
+
+    async def _request(self, method, url, bucket, json=None):
+        # 因為是連線到外部網路，Timeout 預設 10 秒比較保險 (可用 IP_API_TIMEOUT 調整)
+        timeout = aiohttp.ClientTimeout(total=IP_API_TIMEOUT)
+
+        # 使用共用連線池，避免每次查詢都重新建立 TCP 連線
+        session = http_client.get_session()
+        async with session.request(method, url, params={"fields": IP_API_FIELDS}, json=json, timeout=timeout) as response:
+            reset_in = int(response.headers.get('X-Ttl', 60))
+            if 'X-Rl' in response.headers:
+                bucket.update(int(response.headers['X-Rl']), reset_in)
+
+            if response.status == 200:
+                return await response.json()
+            elif response.status == 429:
+                bucket.update(0, reset_in)
+                raise IPAPIRateLimited(reset_in)
+            else:
+                # 如果 API 回傳其他錯誤，拋出錯誤
+                raise RuntimeError(f"IP-API HTTP 錯誤 {response.status}")
+
+ip_api_scheduler = IPAPIScheduler()
+
+# ip-api.com 線上查詢 (經由排程器合併與限速)
+class IPAPIBackend:
+    name = "ip-api"
+    # 可提供的欄位，以及需要額外網路查詢的欄位
+    fields = frozenset(IP_INFO_FIELDS)
+    slow_fields = frozenset()
+
+    async def lookup(self, ip_address, fields=IP_INFO_FIELDS):
+        return await ip_api_scheduler.lookup(ip_address)
+
+# 本地 MaxMind (.mmdb) 資料庫，以 mmap 模式開啟一次後重複使用
+class GeoIPBackend:
+    name = "geoip"
+    # 反向 DNS 需要查詢 PTR 紀錄，其餘欄位都在本機查表
+    slow_fields = frozenset({"reverse"})
+
+    def __init__(self, city_db, isp_db=None):
+        import geoip2.database
+        self.city_reader = geoip2.database.Reader(city_db, locales=[GEOIP_LOCALE, 'en'], mode=geoip2.database.MODE_MMAP)
+        self.isp_reader = None
+        if isp_db:
+            self.isp_reader = geoip2.database.Reader(isp_db, mode=geoip2.database.MODE_MMAP)
+        # 未設定 ISP 資料庫時無法提供 isp
+        self.fields = frozenset(f for f in IP_INFO_FIELDS if f != "isp" or self.isp_reader)
+
+    def _lookup_isp(self, ip_address):
+        # GeoIP2-ISP 提供 isp 欄位；GeoLite2-ASN 只有 AS 組織名稱
+        if 'ISP' in self.isp_reader.metadata().database_type:
+            record = self.isp_reader.isp(ip_address)
+            return record.isp or record.autonomous_system_organization
+        return self.isp_reader.asn(ip_address).autonomous_system_organization
+
+    async def lookup(self, ip_address, fields=IP_INFO_FIELDS):
+        import geoip2.errors
+        import dns.reversename
+        data = {"query": ip_address}
+        try:
+            record = self.city_reader.city(ip_address)
+            data["country"] = record.country.name
+            data["city"] = record.city.name
+        except geoip2.errors.AddressNotFoundError:
+            pass
+
+        if self.isp_reader and "isp" in fields:
+            try:
+                data["isp"] = self._lookup_isp(ip_address)
+            except geoip2.errors.AddressNotFoundError:
+                pass
+
+        # 反向 DNS 由本機解析 PTR 紀錄 (經過 DNS 快取)
+        if "reverse" in fields:
+            ptr = await resolve_record(dns.reversename.from_address(ip_address).to_text(), "PTR")
+            if ptr:
+                data["reverse"] = str(ptr[0].target).rstrip('.')
+
+        if len(data) > 1:
+            data["status"] = "success"
+        return data
+
+_ip_backends = None
+
+# 依設定建立查詢順序：本地資料庫優先，ip-api 作為補充
+def get_ip_backends():
+    global _ip_backends
+    if _ip_backends is None:
+        backends = []
+        if GEOIP_CITY_DB and os.path.exists(GEOIP_CITY_DB):
+            try:
+                backends.append(GeoIPBackend(GEOIP_CITY_DB, GEOIP_ISP_DB or None))
+            except Exception as e:
+                # 資料庫損毀或格式不符時改為只使用 ip-api
+                error.logger.error(f"無法開啟 GeoIP 資料庫，改用 ip-api 查詢: {e}")
+        if IP_API_FALLBACK or not backends:
+            backends.append(IPAPIBackend())
+        _ip_backends = backends
+    return _ip_backends
+
+# 依序詢問各後端並合併結果
+# 後端能提供的欄位即使查無資料 (例如沒有 PTR 紀錄或城市) 也視為最終結果，
+# 只有前面的後端都無法提供的欄位 (例如未設定 ISP 資料庫時的 isp) 才向下一個後端補查
+async def _lookup_ip(ip_address):
+    backends = get_ip_backends()
+    data = {}
+    needed = set(IP_INFO_FIELDS)
+    for index, backend in enumerate(backends):
+        later = frozenset().union(*(b.fields for b in backends[index + 1:]))
+        fields = needed & backend.fields
+        # 確定要向後面的後端補查時，需要額外網路查詢的欄位也交給它 (ip-api 會一併回傳 reverse，不必先等 PTR)
+        if (needed - backend.fields) & later:
+            fields -= backend.slow_fields & later
+
+        try:
+            result = await backend.lookup(ip_address, fields)
+        except Exception as e:
+            # 前面的後端已有資料時，補充查詢失敗不影響結果；還有其他後端時改問下一個；
+            # 否則將錯誤往上拋，交給 commands.py 和 error.py 處理
+            if data.get("status") == "success": break
+            if index + 1 < len(backends): continue
+            raise e
+
+        if result.get("status") == "success":
+            for field in IP_INFO_FIELDS:
+                if result.get(field) and not data.get(field):
+                    data[field] = result[field]
+            data.setdefault("query", result.get("query", ip_address))
+            data["status"] = "success"
+            needed -= fields
+        elif data.get("status") != "success":
+            data = result
+
+        if not needed & later:
+            break
+    return data
+
+# 查詢並寫入快取：成功結果快取較久，失敗與 429 只做短暫的否定快取
+async def _lookup_ip_cached(ip_address):
+    try:
+        data = await _lookup_ip(ip_address)
+    except IPAPIRateLimited as e:
+        ip_cache.set(ip_address, e, max(e.retry_after, 1))
+        raise
+    except Exception as e:
+        ip_cache.set(ip_address, e, IP_NEGATIVE_TTL)
+        raise
+    ip_cache.set(ip_address, data, IP_CACHE_TTL if data.get("status") == "success" else IP_NEGATIVE_TTL)
+    return data
+
+# IP 查詢結果快取與進行中的查詢 (同一 IP 同時只會有一個對外請求)
+ip_cache = TTLCache(IP_CACHE_SIZE)
+_ip_inflight = {}
+
 # IP 查詢 (純邏輯，錯誤往上拋)
 async def get_ip_info(ip_address):
-    # 使用原本的外部 API 網址，並指定需要的欄位
-    url = f"http://ip-api.com/json/{ip_address}?fields=status,message,country,city,isp,reverse,query"
-    
-    # 因為是連線到外部網路，Timeout 設為 10 秒比較保險
-    timeout = aiohttp.ClientTimeout(total=10)
-    
+    cached = ip_cache.get(ip_address, _MISS)
+    if cached is not _MISS:
+        if isinstance(cached, Exception):
+            raise cached.with_traceback(None)
+        return dict(cached)
+
+    task = _ip_inflight.get(ip_address)
+    if task is None:
+        task = asyncio.create_task(_lookup_ip_cached(ip_address))
+        _ip_inflight[ip_address] = task
+        task.add_done_callback(lambda _: _ip_inflight.pop(ip_address, None))
+
+    # shield：單一使用者的互動被取消時，不影響其他共用同一查詢的使用者
+    return dict(await asyncio.shield(task))
+
+# --- 非同步 DNS 解析 ---
+_resolver = None
+
+def get_resolver():
+    # 第一次使用時才建立 (會讀取系統的 resolv.conf)，之後共用同一個實例
+    global _resolver
+    if _resolver is None:
+        import dns.asyncresolver
+        _resolver = dns.asyncresolver.Resolver()
+    return _resolver
+
+# 從否定回應的 SOA 取得可快取秒數 (依 RFC 2308 取 SOA TTL 與 minimum 的較小值)
+def _negative_ttl(response):
+    import dns.rdatatype
+    if response is not None:
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum)
+    return DNS_NEGATIVE_TTL
+
+# 查詢單一紀錄類型，查無資料或失敗時回傳 None
+# cache 為 None 時不讀寫快取 (批量查詢使用，避免擠掉互動查詢的快取項目並影響命中率統計)
+async def resolve_record(host, rdtype, lifetime=DNS_TIMEOUT, cache=dns_cache):
+    import dns.exception
+    import dns.resolver
+    key = (host.lower().rstrip('.'), rdtype)
+    if cache is not None:
+        cached = cache.get(key, _MISS)
+        if cached is not _MISS:
+            return cached
+
     try:
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    # 如果 API 回傳非 200 (例如 429 請求過多)，拋出錯誤
-                    raise RuntimeError(f"IP-API HTTP 錯誤 {response.status}")
-    except Exception as e:
-        # 將錯誤往上拋，交給 commands.py 和 error.py 處理
-        raise e
\ No newline at end of file
+        answer = await get_resolver().resolve(host, rdtype, lifetime=lifetime, raise_on_no_answer=False)
+    except dns.resolver.NXDOMAIN as e:
+        response = next(iter(e.responses().values()), None)
+        if cache is not None:
+            cache.set(key, None, _negative_ttl(response))
+        return None
+    except dns.exception.DNSException:
+        # 逾時或伺服器錯誤屬於暫時性問題，不寫入快取
+        return None
+
+    if answer.rrset is None:
+        if cache is not None:
+            cache.set(key, None, _negative_ttl(answer.response))
+        return None
+
+    records = list(answer)
+    # answer.expiration 已考慮 CNAME 鏈上所有 RRset 的最小 TTL
+    if cache is not None:
+        cache.set(key, records, answer.expiration - time.time())
+    return records
+
+# 同時查詢多種紀錄，總耗時以最慢的單一查詢為上限 (且不超過 timeout)
+async def resolve_all(host, rdtypes=DNS_RECORD_TYPES, timeout=DNS_TIMEOUT, cache=dns_cache):
+    tasks = {rdtype: asyncio.create_task(resolve_record(host, rdtype, timeout, cache)) for rdtype in rdtypes}
+    done, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+    for task in pending:
+        task.cancel()
+
+    results = {}
+    for rdtype, task in tasks.items():
+        if task in done and not task.cancelled() and task.exception() is None:
+            results[rdtype] = task.result()
+        else:
+            results[rdtype] = None
+    return results
+
+# 將單筆 DNS 紀錄轉成顯示用字串
+def format_dns_record(rdtype, record):
+    if rdtype in ("A", "AAAA"):
+        return record.address
+    if rdtype in ("CNAME", "NS"):
+        return str(record.target)
+    if rdtype == "MX":
+        return f"{record.preference}: {record.exchange}"
+    if rdtype == "TXT":
+        return b"".join(record.strings).decode('utf-8', errors='replace')
+    if rdtype == "SOA":
+        return f"{record.mname} {record.rname} (serial {record.serial})"
+    return record.to_text()
+
+# --- WHOIS 查詢 (專用執行緒池 + 持久化快取) ---
+# 持久化快取：所有 SQLite 操作都在同一條專用執行緒中執行
+class WhoisCache:
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='whois-cache')
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS whois_cache (domain TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self._conn.execute("DELETE FROM whois_cache WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+        return self._conn
+
+    def _get(self, domain):
+        row = self._connect().execute("SELECT data FROM whois_cache WHERE domain = ? AND expires_at > ?", (domain, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, domain, data, ttl):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO whois_cache (domain, data, expires_at) VALUES (?, ?, ?)", (domain, json.dumps(data), time.time() + ttl))
+        conn.commit()
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def get(self, domain):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._get, domain)
+
+    async def set(self, domain, data, ttl):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._set, domain, data, ttl)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
+        self._executor.shutdown(wait=False)
+
+whois_cache = WhoisCache(WHOIS_CACHE_PATH)
+_whois_executor = ThreadPoolExecutor(max_workers=WHOIS_WORKERS, thread_name_prefix='whois')
+_whois_pending = 0
+
+def _whois_datetime(d):
+    if isinstance(d, list):
+        d = d[0] if len(d) > 0 else None
+    return d.isoformat() if isinstance(d, datetime) else None
+
+# 在 WHOIS 執行緒中查詢，只保留需要的欄位 (可序列化為 JSON)
+def _fetch_whois(domain):
+    import whois
+    w = whois.whois(domain)
+    name_servers = w.get('name_servers') or []
+    if isinstance(name_servers, str):
+        name_servers = [name_servers]
+    return {
+        "registrar": w.get('registrar'),
+        "creation_date": _whois_datetime(w.get('creation_date')),
+        "expiration_date": _whois_datetime(w.get('expiration_date')),
+        "updated_date": _whois_datetime(w.get('updated_date')),
+        "name_servers": sorted({ns.lower() for ns in name_servers}),
+    }
+
+# 依紀錄穩定程度決定快取秒數：
+# 即將到期或剛更新的網域可能轉移/續約，快取較短；長年未變動的網域快取最久
+def whois_cache_ttl(data, now=None):
+    now = now or datetime.now()
+    parse = lambda d: datetime.fromisoformat(d).replace(tzinfo=None) if d else None
+    created, expires, updated = parse(data["creation_date"]), parse(data["expiration_date"]), parse(data["updated_date"])
+
+    if not data["registrar"] and not expires:
+        return WHOIS_MIN_TTL
+    if expires and expires - now < timedelta(days=30):
+        return WHOIS_MIN_TTL
+    if updated and now - updated < timedelta(days=30):
+        ttl = 6 * 3600
+    elif created and now - created > timedelta(days=365):
+        ttl = WHOIS_MAX_TTL
+    else:
+        ttl = 86400
+
+    # 快取不得超過網域到期前 30 天
+    if expires:
+        ttl = min(ttl, (expires - timedelta(days=30) - now).total_seconds())
+    return int(max(WHOIS_MIN_TTL, min(ttl, WHOIS_MAX_TTL)))
+
+# WHOIS 查詢 (純邏輯，錯誤往上拋)
+async def get_whois_info(domain):
+    global _whois_pending
+    cached = await whois_cache.get(domain)
+    if cached is not None:
+        return cached
+
+    if _whois_pending >= WHOIS_MAX_PENDING:
+        raise RuntimeError(f"WHOIS 查詢佇列已滿 ({WHOIS_MAX_PENDING})，請稍後再試")
+
+    _whois_pending += 1
+    try:
+        data = await asyncio.get_running_loop().run_in_executor(_whois_executor, _fetch_whois, domain)
+    finally:
+        _whois_pending -= 1
+
+    await whois_cache.set(domain, data, whois_cache_ttl(data))
+    return data
+
+async def close_whois():
+    _whois_executor.shutdown(wait=False, cancel_futures=True)
+    await whois_cache.close()